@@ -0,0 +1,161 @@
+import math
+import time
+import threading
+from collections import deque
+
+import instrumentation
+
+queue_depth = instrumentation.Gauge("rag_admission_queue_depth", "Requests waiting for LLM rate budget")
+queue_wait = instrumentation.Histogram("rag_admission_wait_seconds", "Time admitted requests waited for LLM rate budget",
+                                       instrumentation.LATENCY_BUCKETS)
+decisions = instrumentation.Counter("rag_admission_total", "Admission decisions by outcome", ["outcome"])
+instrumentation.METRICS.extend([queue_depth, queue_wait, decisions])
+
+
+class Overloaded(Exception):
+    """The request was not admitted; retry after `retry_after` seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Holds up to one minute's budget and refills continuously at per_minute / 60 per second"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def shortfall(self, amount):
+        """Seconds until `amount` is available, after the last refill"""
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+
+class Permit:
+    def __init__(self, controller, tokens):
+        self.controller = controller
+        self.tokens = tokens
+        self.settled = False
+
+    def settle(self, used_tokens=None):
+        """Correct the token charge to what the call really used; 0 also returns the request slot"""
+        if not self.settled and used_tokens is not None:
+            self.controller.refund(1 if used_tokens == 0 else 0, self.tokens - used_tokens)
+        self.settled = True
+
+
+class AdmissionController:
+    """FIFO admission of LLM-bound requests under requests-per-minute and tokens-per-minute budgets.
+
+    A request waits in line until both buckets can pay for it. It is shed right away when
+    the line is full or its expected wait would pass its deadline, and dropped from the
+    line if the deadline passes while it waits. Token charges are estimates up front and
+    are corrected once the real usage is known.
+    """
+
+    def __init__(self, rpm=0, tpm=0, max_queue=64, max_wait=10.0):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.stats = {"admitted": 0, "shed": 0, "expired": 0, "peak_depth": 0, "wait_seconds": 0.0}
+
+    @property
+    def enabled(self):
+        return self.requests is not None or self.tokens is not None
+
+    def costs(self, tokens):
+        return [(bucket, amount) for bucket, amount in ((self.requests, 1), (self.tokens, tokens)) if bucket is not None]
+
+    def refill(self, now):
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.refill(now)
+
+    def expected_wait(self, tokens):
+        """Seconds until everyone in line and then this request could be paid for"""
+        ahead = [ticket[0] for ticket in self.queue] + [tokens]
+        totals = {id(bucket): (bucket, 0.0) for bucket, _ in self.costs(tokens)}
+        for t in ahead:
+            for bucket, amount in self.costs(t):
+                totals[id(bucket)] = (bucket, totals[id(bucket)][1] + min(amount, bucket.capacity))
+        return max((max(0.0, amount - bucket.level) / bucket.rate for bucket, amount in totals.values()), default=0.0)
+
+    def shed(self, outcome, wait):
+        self.stats[outcome] += 1
+        decisions.inc(outcome=outcome)
+        return Overloaded("The language model's rate budget is used up. Please try again shortly.",
+                          max(1, math.ceil(wait)))
+
+    def admit(self, tokens, deadline=None):
+        """Block until the request may call the LLM and return its Permit, or raise Overloaded.
+
+        deadline is a time.monotonic() value; by default the request may wait max_wait seconds.
+        """
+        if not self.enabled:
+            return Permit(self, tokens)
+        started = time.monotonic()
+        deadline = started + self.max_wait if deadline is None else deadline
+        with self.cond:
+            self.refill(started)
+            wait = self.expected_wait(tokens)
+            if len(self.queue) >= self.max_queue or started + wait > deadline:
+                raise self.shed("shed", wait)
+            # a list holding the cost, so equal costs are still distinct entries in the line
+            ticket = [tokens]
+            self.queue.append(ticket)
+            self.stats["peak_depth"] = max(self.stats["peak_depth"], len(self.queue))
+            queue_depth.set(len(self.queue))
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    pause = deadline - now
+                    if self.queue[0] is ticket:
+                        short = max((bucket.shortfall(amount) for bucket, amount in self.costs(tokens)), default=0.0)
+                        if short == 0.0:
+                            for bucket, amount in self.costs(tokens):
+                                bucket.level -= min(amount, bucket.capacity)
+                            self.queue.popleft()
+                            waited = now - started
+                            self.stats["admitted"] += 1
+                            self.stats["wait_seconds"] += waited
+                            decisions.inc(outcome="admitted")
+                            queue_wait.observe(waited)
+                            return Permit(self, min(tokens, self.tokens.capacity) if self.tokens else tokens)
+                        pause = min(pause, short)
+                    if deadline - now <= 0:
+                        self.queue.remove(ticket)
+                        raise self.shed("expired", self.expected_wait(tokens))
+                    self.cond.wait(pause)
+            finally:
+                queue_depth.set(len(self.queue))
+                self.cond.notify_all()
+
+    def refund(self, requests, tokens):
+        with self.cond:
+            self.refill(time.monotonic())
+            if self.requests is not None and requests:
+                self.requests.level = min(self.requests.capacity, self.requests.level + requests)
+            if self.tokens is not None and tokens:
+                # a negative refund (more used than estimated) is owed out of future budget
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + tokens)
+            self.cond.notify_all()
+
+    def snapshot(self):
+        with self.cond:
+            self.refill(time.monotonic())
+            admitted = self.stats["admitted"]
+            return dict(self.stats, depth=len(self.queue), max_queue=self.max_queue, max_wait=self.max_wait,
+                        mean_wait_seconds=self.stats["wait_seconds"] / admitted if admitted else 0.0,
+                        requests_available=None if self.requests is None else round(self.requests.level, 1),
+                        tokens_available=None if self.tokens is None else round(self.tokens.level, 1))
@@ -0,0 +1,125 @@
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize(query):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", query.lower())).strip()
+
+
+class AnswerCache:
+    """LRU + TTL cache of generated answers, matched exactly or by query-embedding similarity.
+
+    Entries belong to one index version; when the version changes the cache is cleared.
+    """
+
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1000, max_bytes=32 * 1024 * 1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.version = None
+        self.matrix = None
+        self.keys = []
+        self.lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def entry_size(self, key, answer, vector):
+        return sys.getsizeof(key) + sys.getsizeof(answer) + vector.nbytes
+
+    def check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.stats["invalidations"] += 1
+            self.entries.clear()
+            self.bytes = 0
+            self.matrix = None
+            self.version = version
+
+    def drop(self, key):
+        answer, vector, _ = self.entries.pop(key)
+        self.bytes -= self.entry_size(key, answer, vector)
+        self.matrix = None
+
+    def expire(self, now):
+        # LRU order is not creation order, so every entry's age is checked
+        for key in [k for k, (_, _, created) in self.entries.items() if now - created >= self.ttl]:
+            self.drop(key)
+            self.stats["evictions"] += 1
+
+    def nearest(self, vector):
+        if not self.entries:
+            return None, 0.0
+        if self.matrix is None:
+            self.keys = list(self.entries)
+            self.matrix = np.stack([self.entries[k][1] for k in self.keys])
+        scores = self.matrix @ vector
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+    @staticmethod
+    def unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, query, version, embed, count=True):
+        """Return a cached answer or None; `embed` is only called when there is no exact match.
+
+        count=False looks without touching the hit/miss counters.
+        """
+        key = normalize(query)
+        with self.lock:
+            self.check_version(version)
+            self.expire(time.time())
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                if count:
+                    self.stats["exact_hits"] += 1
+                return self.entries[key][0]
+            if not self.entries or self.threshold > 1:
+                if count:
+                    self.stats["misses"] += 1
+                return None
+        vector = self.unit(embed(query))
+        with self.lock:
+            if not self.entries:
+                if count:
+                    self.stats["misses"] += 1
+                return None
+            match, score = self.nearest(vector)
+            if match is not None and score >= self.threshold:
+                self.entries.move_to_end(match)
+                if count:
+                    self.stats["semantic_hits"] += 1
+                return self.entries[match][0]
+            if count:
+                self.stats["misses"] += 1
+            return None
+
+    def put(self, query, answer, version, embed):
+        key = normalize(query)
+        vector = self.unit(embed(query))
+        with self.lock:
+            self.check_version(version)
+            if key in self.entries:
+                self.drop(key)
+            self.entries[key] = (answer, vector, time.time())
+            self.bytes += self.entry_size(key, answer, vector)
+            self.matrix = None
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                self.drop(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            return dict(self.stats, entries=len(self.entries), bytes=self.bytes,
+                        hit_rate=hits / lookups if lookups else 0.0, threshold=self.threshold)
@@ -1,10 +1,22 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 import os
+import json
 import sys
+import time
+import threading
 import importlib.util
 import traceback
 
+try:
+    import instrumentation
+except ImportError as e:
+    # metrics need langchain_core; the mock implementation still works without it
+    print(f"Metrics disabled: {str(e)}")
+    instrumentation = None
+
 app = Flask(__name__)
+rag_module = None
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
 
 # Mock generate function to use when the real one can't be imported
 def mock_generate(query):
@@ -29,6 +41,7 @@ def mock_generate(query):
 
 # Dynamically import the generate function from rag.py
 def import_generate_function():
+    global rag_module
     try:
         # Check if rag.py exists
         rag_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag.py")
@@ -37,31 +50,122 @@ def import_generate_function():
             return None
             
         spec = importlib.util.spec_from_file_location("rag", rag_path)
-        rag_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(rag_module)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
         
-        if not hasattr(rag_module, "generate"):
+        if not hasattr(module, "generate"):
             print("Error: generate function not found in rag.py")
             return None
-            
-        return rag_module.generate
+
+        rag_module = module
+        return module.generate
     except Exception as e:
         print(f"Error importing generate function: {str(e)}")
         traceback.print_exc()
         return None
 
-# Try to import the generate function, fall back to mock if it fails
-try:
-    generate = import_generate_function()
-    if generate is None:
+# RAG stack state; initialized in the background so the server binds immediately
+startup = {'state': 'starting', 'timings': {}, 'error': None}
+startup_ready = threading.Event()
+
+def initializing_generate(query):
+    return "Error: The RAG system is still starting up. Please try again shortly."
+
+generate = initializing_generate
+
+def initialize():
+    """Import rag.py, warm up the model and index, then switch generate to the real implementation"""
+    global generate
+    started = time.perf_counter()
+    try:
+        real_generate = import_generate_function()
+        startup['timings']['import_rag'] = time.perf_counter() - started
+        if real_generate is None:
+            generate = mock_generate
+            startup['state'] = 'degraded'
+            print(f"RAG system initialization failed. Using mock implementation.")
+        else:
+            if hasattr(rag_module, "warmup"):
+                try:
+                    rag_module.warmup()
+                except Exception as e:
+                    print(f"Warmup failed: {str(e)}")
+            startup['timings'].update(getattr(rag_module, "startup_timings", {}))
+            if hasattr(rag_module, "watch_index"):
+                rag_module.watch_index()
+            if os.getenv("ASYNC_SERVING", "0") == "1" and hasattr(rag_module, "generate_async"):
+                # LLM calls run on one shared event loop, capped and coalesced; each request
+                # still holds its WSGI thread until the answer comes back
+                real_generate = rag_module.generate_async
+                print(f"Async serving enabled (max {rag_module.max_concurrent_llm} concurrent LLM calls).")
+            generate = real_generate
+            startup['state'] = 'ready'
+            print(f"RAG system initialized successfully.")
+    except (Exception, SystemExit) as e:
+        # rag.py exits when the API key is missing; that must not kill the init thread silently
+        print(f"Error initializing RAG system: {str(e)}")
+        startup['error'] = str(e)
+        startup['state'] = 'degraded'
         generate = mock_generate
-        print(f"RAG system initialization failed. Using mock implementation.")
-    else:
-        print(f"RAG system initialized successfully.")
-except Exception as e:
-    print(f"Error initializing RAG system: {str(e)}")
-    generate = mock_generate
-    print(f"Using mock implementation.")
+        print(f"Using mock implementation.")
+    finally:
+        startup['timings']['total'] = time.perf_counter() - started
+        print("Startup timings: " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in startup['timings'].items()))
+        startup_ready.set()
+
+def wait_until_ready(timeout=None):
+    return startup_ready.wait(timeout)
+
+def starting_response():
+    return jsonify({'error': 'The RAG system is still starting up. Please try again shortly.'}), 503, {'Retry-After': '5'}
+
+threading.Thread(target=initialize, name="rag-init", daemon=True).start()
+
+def request_deadline(data):
+    """time.monotonic() deadline from an optional "deadline" (seconds) in the request body"""
+    seconds = data.get('deadline')
+    if seconds is None:
+        return None
+    if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0:
+        raise ValueError('deadline must be a positive number of seconds')
+    return time.monotonic() + seconds
+
+def overloaded_response(e):
+    return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+def admit(user_query, deadline):
+    """Wait for LLM rate budget; returns (permit, None) or (None, 429 response)"""
+    if rag_module is None or not hasattr(rag_module, "admit") or generate is mock_generate:
+        return None, None
+    try:
+        return rag_module.admit(user_query, deadline), None
+    except rag_module.Overloaded as e:
+        return None, overloaded_response(e)
+
+def settle(permit):
+    """Correct the permit's token charge with the tokens this request's trace saw"""
+    if permit is not None:
+        used = sum(g.trace.tokens.values()) if instrumentation is not None else None
+        permit.settle(used)
+
+@app.before_request
+def start_request_trace():
+    g.started = time.perf_counter()
+    if instrumentation is not None:
+        g.trace = instrumentation.start_trace()
+
+@app.after_request
+def record_request_metrics(response):
+    if instrumentation is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    instrumentation.http_seconds.observe(time.perf_counter() - g.started, route=route,
+                                         status=response.status_code)
+    if SERVER_TIMING:
+        timing = g.trace.server_timing()
+        if timing:
+            response.headers['Server-Timing'] = timing
+    return response
 
 @app.route('/')
 def index():
@@ -78,9 +182,23 @@ def query():
         user_query = data.get('query', '').strip()
         if not user_query:
             return jsonify({'error': 'No query provided'}), 400
-        
+
+        if startup['state'] == 'starting':
+            return starting_response()
+
+        try:
+            deadline = request_deadline(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        permit, rejected = admit(user_query, deadline)
+        if rejected:
+            return rejected
+
         # Generate response
-        response = generate(user_query)
+        try:
+            response = generate(user_query)
+        finally:
+            settle(permit)
         
         # Check if the response is an error message
         if response and response.startswith("Error:"):
@@ -92,6 +210,142 @@ def query():
         traceback.print_exc()
         return jsonify({'error': 'An unexpected error occurred processing your request'}), 500
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "1000"))
+
+@app.route('/query/batch', methods=['POST'])
+def query_batch():
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+
+        queries = data.get('queries')
+        if not isinstance(queries, list) or not queries:
+            return jsonify({'error': 'No queries provided'}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'}), 400
+        max_concurrency = data.get('max_concurrency')
+        if max_concurrency is not None and (not isinstance(max_concurrency, int) or max_concurrency < 1):
+            return jsonify({'error': 'max_concurrency must be a positive integer'}), 400
+        if startup['state'] == 'starting':
+            return starting_response()
+        try:
+            deadline = request_deadline(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if rag_module is not None and hasattr(rag_module, "generate_batch"):
+            # each query waits for its own rate budget right before its LLM call
+            results = rag_module.generate_batch(queries, max_concurrency, deadline)
+        else:
+            results = []
+            for q in queries:
+                response = generate(str(q))
+                results.append({'error': response[7:]} if response.startswith("Error:") else {'response': response})
+
+        return jsonify({'results': results})
+    except Exception as e:
+        print(f"Error processing batch query: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': 'An unexpected error occurred processing your request'}), 500
+
+@app.route('/query/stream', methods=['POST'])
+def query_stream():
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+
+    user_query = data.get('query', '').strip()
+    if not user_query:
+        return jsonify({'error': 'No query provided'}), 400
+    if startup['state'] == 'starting':
+        return starting_response()
+    try:
+        deadline = request_deadline(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # admitted before the response starts, so a shed request still gets a plain 429
+    permit, rejected = admit(user_query, deadline)
+    if rejected:
+        return rejected
+
+    if rag_module is not None and hasattr(rag_module, "generate_stream"):
+        events = rag_module.generate_stream(user_query)
+    else:
+        answer = generate(user_query)
+        events = [("token", answer), ("done", answer)]
+
+    def stream():
+        try:
+            for event, text in events:
+                if event == "token":
+                    yield sse("token", {'token': text})
+                elif event == "error":
+                    # same shape as the /query error body, sent as the terminal event
+                    yield sse("error", {'error': text[7:] if text.startswith("Error:") else text})
+                else:
+                    yield sse("done", {'response': text})
+        except Exception as e:
+            print(f"Error streaming query: {str(e)}")
+            traceback.print_exc()
+            yield sse("error", {'error': 'An unexpected error occurred processing your request'})
+        finally:
+            settle(permit)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    body = {'status': startup['state'], 'timings_ms': {k: round(v * 1000, 1) for k, v in startup['timings'].items()}}
+    if startup['error']:
+        body['error'] = startup['error']
+    # degraded still serves the mock answers, so it counts as ready
+    return jsonify(body), 503 if startup['state'] == 'starting' else 200
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if rag_module is None or not hasattr(rag_module, "cache_stats"):
+        return jsonify({'error': 'Answer cache is not available'}), 503
+    return jsonify(rag_module.cache_stats())
+
+@app.route('/context/stats', methods=['GET'])
+def context_stats():
+    if rag_module is None or not hasattr(rag_module, "context_stats"):
+        return jsonify({'error': 'Context packing is not available'}), 503
+    return jsonify(rag_module.context_stats())
+
+@app.route('/relevance/stats', methods=['GET'])
+def relevance_stats():
+    if rag_module is None or not hasattr(rag_module, "relevance_stats"):
+        return jsonify({'error': 'Relevance gating is not available'}), 503
+    return jsonify(rag_module.relevance_stats())
+
+@app.route('/admission/stats', methods=['GET'])
+def admission_stats():
+    if rag_module is None or not hasattr(rag_module, "admission_stats"):
+        return jsonify({'error': 'Admission control is not available'}), 503
+    return jsonify(rag_module.admission_stats())
+
+@app.route('/serving/stats', methods=['GET'])
+def serving_stats():
+    if rag_module is None or not hasattr(rag_module, "serving_stats"):
+        return jsonify({'error': 'Serving stats are not available'}), 503
+    return jsonify(rag_module.serving_stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if instrumentation is None:
+        return jsonify({'error': 'Metrics are not available'}), 503
+    return Response(instrumentation.render_metrics(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     # Check if templates directory exists
     templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+
+class AsyncRunner:
+    """A background event loop that runs upstream calls with bounded concurrency.
+
+    Callers on any thread submit coroutines; identical in-flight keys share one call
+    (single-flight), and at most `max_concurrency` calls run upstream at a time.
+    """
+
+    def __init__(self, max_concurrency=8):
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+        self.inflight = {}
+        self.stats = {"calls": 0, "coalesced": 0, "active": 0, "peak_active": 0}
+        self.semaphore = None
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(ready,), name="async-runner", daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        ready.set()
+        self.loop.run_forever()
+
+    async def single_flight(self, key, factory):
+        """Await factory() once per key among concurrent callers and share its result"""
+        future = self.inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        future = self.loop.create_future()
+        self.inflight[key] = future
+        try:
+            async with self.semaphore:
+                self.stats["calls"] += 1
+                self.stats["active"] += 1
+                self.stats["peak_active"] = max(self.stats["peak_active"], self.stats["active"])
+                try:
+                    result = await factory()
+                finally:
+                    self.stats["active"] -= 1
+            future.set_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            del self.inflight[key]
+        return future.result()
+
+    def submit(self, coro, timeout=None):
+        """Run a coroutine on the loop from a synchronous thread and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def snapshot(self):
+        return dict(self.stats, inflight=len(self.inflight), max_concurrency=self.max_concurrency)
+
+
+class SingleFlight:
+    """Single-flight for plain threads: concurrent callers with the same key share one fn() call"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self.inflight[key] = {"done": threading.Event()}
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn()
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            call["done"].set()
+        return call["result"]
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, inflight=len(self.inflight))
@@ -0,0 +1,139 @@
+"""Request spikes against a rate-limited LLM provider, with and without admission control.
+
+    python benchmarks/admission.py --rpm 120 --requests 240 --concurrency 32
+
+A local OpenAI-compatible stand-in enforces --rpm with its own token bucket and answers
+429 + Retry-After beyond it. Without admission control every request goes straight to it
+and retries; with it, requests queue for budget (up to --max-wait) or are shed at once
+with a Retry-After, and the provider never sees more than it allows.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage
+
+from admission import AdmissionController, Overloaded, TokenBucket
+from common import percentile
+from llm_backend import LLMError, OpenAICompatibleChat
+
+
+def limited_server(rpm, latency):
+    bucket = TokenBucket(rpm)
+    lock = threading.Lock()
+    counts = {"requests": 0, "429": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, body, headers=()):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with lock:
+                counts["requests"] += 1
+                bucket.refill(time.monotonic())
+                allowed = bucket.level >= 1
+                if allowed:
+                    bucket.level -= 1
+                else:
+                    counts["429"] += 1
+                    wait = bucket.shortfall(1)
+            if not allowed:
+                return self.send_json(429, {"error": {"message": "rate limited"}}, [("Retry-After", f"{wait:.2f}")])
+            time.sleep(latency)
+            self.send_json(200, {"choices": [{"message": {"role": "assistant", "content": "ok"}}],
+                                 "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11}})
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            pass
+
+    return Server(("127.0.0.1", 0), Handler), counts
+
+
+def spike(llm, controller, requests, concurrency):
+    done, failed, shed = [], [], []
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            if controller is not None:
+                permit = controller.admit(11)
+            llm.invoke([HumanMessage(content=f"question {i}")])
+            if controller is not None:
+                permit.settle(11)
+            done.append(time.perf_counter() - start)
+        except Overloaded:
+            shed.append(time.perf_counter() - start)
+        except LLMError:
+            failed.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return {"seconds": time.perf_counter() - start, "ok": len(done), "failed": len(failed), "shed": len(shed),
+            "ok_p50_ms": percentile(done, 50) * 1000, "ok_p99_ms": percentile(done, 99) * 1000,
+            "failed_p50_ms": percentile(failed, 50) * 1000, "shed_p50_ms": percentile(shed, 50) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rpm", type=int, default=120, help="provider limit, also the admission budget")
+    parser.add_argument("--requests", type=int, default=240)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--max-wait", type=float, default=10.0, help="admission deadline per request")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for setup in ("direct", "admission"):
+        server, counts = limited_server(args.rpm, args.latency)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        llm = OpenAICompatibleChat(base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", api_key="bench",
+                                   model="stand-in", max_retries=args.max_retries, timeout=60,
+                                   pool_size=args.concurrency)
+        controller = AdmissionController(rpm=args.rpm, max_queue=args.concurrency * 4, max_wait=args.max_wait) \
+            if setup == "admission" else None
+        result = spike(llm, controller, args.requests, args.concurrency)
+        result.update(setup=setup, upstream_requests=counts["requests"], upstream_429=counts["429"])
+        results.append(result)
+        server.shutdown()
+        server.server_close()
+
+    print(f"{args.requests} requests at concurrency {args.concurrency} against a {args.rpm} RPM provider")
+    print(f"{'setup':<10} {'ok':>5} {'failed':>7} {'shed':>5} {'ok p50':>8} {'ok p99':>8} {'fail p50':>9} "
+          f"{'shed p50':>9} {'upstream':>9} {'429s':>6}")
+    for r in results:
+        print(f"{r['setup']:<10} {r['ok']:>5} {r['failed']:>7} {r['shed']:>5} {r['ok_p50_ms']:>8.0f} "
+              f"{r['ok_p99_ms']:>8.0f} {r['failed_p50_ms']:>9.0f} {r['shed_p50_ms']:>9.0f} "
+              f"{r['upstream_requests']:>9} {r['upstream_429']:>6}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Helpers shared by the benchmark scripts"""
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
@@ -0,0 +1,129 @@
+"""Chunks and embedding time saved by MinHash/LSH near-duplicate filtering at ingest.
+
+    python benchmarks/dedup.py --books 40 --boilerplate 0.3
+    python benchmarks/dedup.py --dir books --threshold 0.8
+
+Synthetic books mix unique prose with shared boilerplate paragraphs (abstracts, license
+text) that are lightly edited in each copy. The filter's decisions are checked against an
+exact pairwise Jaccard pass over the first --exact chunks.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from bm25_index import tokenize
+from dedup import SHINGLE_WORDS, SIMILARITY, NearDuplicateFilter
+from loaders import discover_files, load_file
+from splitter import FastSplitter
+
+WORDS = ("block chain hash nonce miner validator stake slot epoch leader ledger proof history consensus "
+         "fork reorg mempool gas fee account contract state root signature license warranty permission "
+         "abstract network peer transaction merkle difficulty reward").split()
+
+
+def paragraph(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def edited(rng, text, edits):
+    words = text.split(" ")
+    for _ in range(edits):
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+def synthetic_books(count, paragraphs, boilerplate, seed=0):
+    rng = random.Random(seed)
+    shared = [paragraph(rng, rng.randint(150, 400)) for _ in range(12)]
+    docs = []
+    for i in range(count):
+        parts = [edited(rng, rng.choice(shared), rng.randint(0, 4)) if rng.random() < boilerplate
+                 else paragraph(rng, rng.randint(40, 300)) for _ in range(paragraphs)]
+        docs.append(Document(page_content="\n\n".join(parts), metadata={"source": f"book{i}.txt"}))
+    return docs
+
+
+def shingles(text):
+    tokens = tokenize(text)
+    k = min(SHINGLE_WORDS, len(tokens))
+    return {tuple(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+
+def exact_kept(chunks, threshold):
+    """Same greedy keep-first rule as the filter, with exact Jaccard against every kept chunk"""
+    kept = []
+    flags = []
+    for chunk in chunks:
+        s = shingles(chunk.page_content)
+        dup = bool(s) and any(len(s & k) / len(s | k) >= threshold for k in kept)
+        if not dup:
+            kept.append(s)
+        flags.append(not dup)
+    return flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", help="directory of books instead of synthetic text")
+    parser.add_argument("--books", type=int, default=40)
+    parser.add_argument("--paragraphs", type=int, default=60)
+    parser.add_argument("--boilerplate", type=float, default=0.3, help="share of synthetic paragraphs that are boilerplate")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY)
+    parser.add_argument("--exact", type=int, default=2000, help="chunks checked against exact Jaccard (0 skips)")
+    parser.add_argument("--embed-sample", type=int, default=64,
+                        help="chunks embedded with the real model to price a saved embedding (0 skips)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.dir:
+        docs = [d for name in discover_files(args.dir) for d in load_file(os.path.join(args.dir, name))[0]]
+    else:
+        docs = synthetic_books(args.books, args.paragraphs, args.boilerplate)
+    chunks = FastSplitter(1000, 200).split_documents(docs)
+
+    dedup = NearDuplicateFilter(args.threshold)
+    flags = [dedup.check(c) is None for c in chunks]
+    result = {"chunks": len(chunks), "dropped": dedup.dropped, "dedup_seconds": dedup.seconds,
+              "chunks_per_s": len(chunks) / max(dedup.seconds, 1e-9),
+              "bands": dedup.bands, "rows": dedup.rows, "threshold": args.threshold}
+    print(f"{len(chunks)} chunks, {dedup.summary()}")
+    print(f"filter speed: {result['chunks_per_s']:.0f} chunks/s")
+
+    if args.exact:
+        sample = chunks[:args.exact]
+        expected = exact_kept(sample, args.threshold)
+        got = flags[:len(sample)]
+        true_dups = sum(1 for e in expected if not e)
+        caught = sum(1 for e, g in zip(expected, got) if not e and not g)
+        wrong = sum(1 for e, g in zip(expected, got) if e and not g)
+        result.update(exact_sample=len(sample), exact_duplicates=true_dups, recall=caught / true_dups if true_dups else 1.0,
+                      false_drops=wrong)
+        print(f"exact check on {len(sample)} chunks: {true_dups} duplicates, recall {result['recall']:.3f}, "
+              f"{wrong} chunks dropped below the threshold")
+
+    if args.embed_sample:
+        from my_langchain import hf_embeddings
+        model = hf_embeddings()
+        texts = [c.page_content for c in chunks[:args.embed_sample]]
+        model.embed_documents(texts[:2])
+        start = time.perf_counter()
+        model.embed_documents(texts)
+        per_chunk = (time.perf_counter() - start) / len(texts)
+        result.update(embed_seconds_per_chunk=per_chunk, embed_seconds_saved=per_chunk * dedup.dropped)
+        print(f"embedding: {per_chunk * 1000:.1f} ms/chunk, so {per_chunk * dedup.dropped:.1f}s saved "
+              f"for {dedup.seconds:.1f}s of filtering")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Embedding throughput of one in-process model against ParallelEmbeddings worker processes.
+
+    python benchmarks/embedding.py --texts 4096 --call-size 256 --workers 2 4
+
+Texts are embedded in calls of --call-size, the batch size ingest hands to the
+embeddings (my_langchain.BATCH_SIZE), so small calls that leave workers idle show up.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_engine import DEFAULT_BATCH_SIZE, ParallelEmbeddings
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+WORDS = ("block chain hash nonce miner validator stake slot epoch leader ledger proof history "
+         "consensus fork reorg mempool gas fee account contract state root signature").split()
+
+
+def synthetic_chunks(n, seed=0):
+    """Chunk-sized texts of varying length, like the splitter's output"""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 180))) for _ in range(n)]
+
+
+def run(embed_documents, texts, call_size):
+    start = time.perf_counter()
+    for i in range(0, len(texts), call_size):
+        embed_documents(texts[i:i + call_size])
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=4096)
+    parser.add_argument("--call-size", type=int, default=256, help="texts per embed_documents call")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="model batch size")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    texts = synthetic_chunks(args.texts)
+    model = SentenceTransformer(MODEL_NAME, device="cpu")
+    single = run(lambda batch: model.encode(batch, batch_size=args.batch_size, show_progress_bar=False),
+                 texts, args.call_size)
+    results = [{"engine": "default", "workers": 1, "texts_per_second": single}]
+    for workers in args.workers:
+        engine = ParallelEmbeddings(MODEL_NAME, workers, args.batch_size)
+        try:
+            # the first call spawns the workers and loads their models
+            engine.embed_documents(texts[:workers])
+            results.append({"engine": "parallel", "workers": workers,
+                            "texts_per_second": run(engine.embed_documents, texts, args.call_size)})
+        finally:
+            engine.close()
+
+    print(f"{args.texts} texts in calls of {args.call_size}, model batch size {args.batch_size}")
+    print(f"{'engine':<10} {'workers':>8} {'texts/s':>9} {'speedup':>8}")
+    for r in results:
+        print(f"{r['engine']:<10} {r['workers']:>8} {r['texts_per_second']:>9.1f} "
+              f"{r['texts_per_second'] / single:>7.2f}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Offline end-to-end benchmark: ingest, query embedding, retrieval and /query under load.
+
+    python benchmarks/end_to_end.py --json results.json
+    python benchmarks/end_to_end.py --books books --concurrency 1 8 32 --llm-latency 0.5
+
+No Groq key or network is needed: rag.py runs with LLM_BACKEND=stub, a deterministic
+model with simulated latency, and the index is built from scratch in a temporary directory
+(from --books, or a synthetic corpus) with a cold embedding cache.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import platform
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import percentile
+
+TOPICS = {
+    "bitcoin": ["proof of work", "miners", "difficulty adjustment", "UTXO set", "halving", "mempool"],
+    "ethereum": ["proof of stake", "validators", "EVM", "gas", "EIP-1559", "smart contracts"],
+    "solana": ["proof of history", "leaders", "Sealevel", "Turbine", "Gulf Stream", "rent"],
+}
+QUERY_TEMPLATES = [
+    "How does {term} work in {topic}?",
+    "What role does {term} play in {topic}?",
+    "Explain {term} for {topic} developers.",
+    "Why does {topic} rely on {term}?",
+]
+
+
+def latency_stats(seconds):
+    return {
+        "count": len(seconds),
+        "mean_ms": sum(seconds) / len(seconds) * 1000 if seconds else 0.0,
+        "p50_ms": percentile(seconds, 50) * 1000,
+        "p95_ms": percentile(seconds, 95) * 1000,
+        "p99_ms": percentile(seconds, 99) * 1000,
+    }
+
+
+def synthetic_corpus(books_dir, files, paragraphs, seed=0):
+    """Deterministic blockchain-flavoured text files, roughly 600 bytes per paragraph"""
+    rng = random.Random(seed)
+    os.makedirs(books_dir, exist_ok=True)
+    topics = list(TOPICS)
+    for n in range(files):
+        topic = topics[n % len(topics)]
+        lines = []
+        for p in range(paragraphs):
+            sentences = []
+            for _ in range(6):
+                term, other = rng.sample(TOPICS[topic], 2)
+                sentences.append(f"In {topic}, {term} interacts with {other} to keep block {rng.randrange(10 ** 6)} "
+                                 f"consistent across {rng.randrange(2, 5000)} nodes.")
+            lines.append(" ".join(sentences))
+        with open(os.path.join(books_dir, f"{topic}_{n:03d}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(lines))
+
+
+def make_queries(n, seed=1):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        topic = rng.choice(list(TOPICS))
+        queries.append(rng.choice(QUERY_TEMPLATES).format(term=rng.choice(TOPICS[topic]), topic=topic))
+    return queries
+
+
+def bench_ingest(my_langchain, root, persist_dir, backend, batch_size, workers):
+    files = my_langchain.discover_files(os.path.join(root, "books"))
+    progress = my_langchain.Progress(every=float("inf"))
+    docs = my_langchain.iter_ingest(root, files, progress, workers)
+    chunks = my_langchain.iter_splitting(docs, progress)
+    my_langchain.vectordb(persist_dir, chunks, batch_size, progress, backend)
+    elapsed = time.perf_counter() - progress.start
+    size = sum(os.path.getsize(os.path.join(root, "books", name)) for name in files)
+    return {
+        "files": len(files),
+        "bytes": size,
+        "docs": progress.docs,
+        "chunks": progress.chunks,
+        "seconds": elapsed,
+        "mb_per_s": size / 1e6 / elapsed,
+        "chunks_per_s": progress.chunks / elapsed,
+        "embedded_per_s": progress.embedded / elapsed,
+    }
+
+
+def bench_embedding(embeddings, queries):
+    # the model itself, not the embedding cache in front of it
+    model = embeddings.embeddings
+    model.embed_query(queries[0])
+    seconds = []
+    for q in queries:
+        start = time.perf_counter()
+        model.embed_query(q)
+        seconds.append(time.perf_counter() - start)
+    return latency_stats(seconds)
+
+
+def bench_retrieval(chain, queries):
+    chain.first.invoke(queries[0])
+    seconds = []
+    for q in queries:
+        start = time.perf_counter()
+        chain.first.invoke(q)
+        seconds.append(time.perf_counter() - start)
+    return latency_stats(seconds)
+
+
+def serve(app):
+    """Run the Flask app on a free local port in a daemon thread; returns the base URL"""
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def post(url, query, timeout=60):
+    body = json.dumps({"query": query}).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def bench_http(base_url, queries, concurrency):
+    seconds = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(q):
+        start = time.perf_counter()
+        status = post(base_url + "/query", q)
+        elapsed = time.perf_counter() - start
+        with lock:
+            seconds.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    elapsed = time.perf_counter() - start
+    return dict(latency_stats(seconds), concurrency=concurrency, requests=len(queries),
+                qps=len(queries) / elapsed, errors=sum(n for s, n in statuses.items() if s != 200),
+                statuses={str(s): n for s, n in sorted(statuses.items())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", help="directory of .txt/.md/.pdf files (default: a synthetic corpus)")
+    parser.add_argument("--files", type=int, default=12, help="synthetic corpus: number of files")
+    parser.add_argument("--paragraphs", type=int, default=200, help="synthetic corpus: paragraphs per file")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None, help="loader processes")
+    parser.add_argument("--queries", type=int, default=100, help="queries for the embedding/retrieval stages")
+    parser.add_argument("--requests", type=int, default=200, help="/query requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stub LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--json", help="write results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="end_to_end_")
+    # configure rag.py before anything imports it: offline model, cold cache, no answer cache or reloads
+    os.environ.update({
+        "LLM_BACKEND": "stub",
+        "STUB_LLM_LATENCY": str(args.llm_latency),
+        "STUB_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "EMBEDDING_CACHE": os.path.join(root, "embedding_cache.sqlite"),
+        "ANSWER_CACHE_ENABLED": "0",
+        "INDEX_WATCH_INTERVAL": "0",
+    })
+    try:
+        books = os.path.join(root, "books")
+        if args.books:
+            shutil.copytree(args.books, books)
+        else:
+            synthetic_corpus(books, args.files, args.paragraphs)
+
+        import my_langchain
+        persist_dir = os.path.join(root, "db")
+        print("Benchmarking ingest...", file=sys.stderr)
+        results = {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "config": vars(args),
+            "ingest": bench_ingest(my_langchain, root, persist_dir, args.backend, args.batch_size, args.workers),
+        }
+
+        import app as flask_app
+        flask_app.wait_until_ready()
+        rag = flask_app.rag_module
+        if rag is None or flask_app.startup["state"] != "ready":
+            raise RuntimeError(f"RAG system failed to start: {flask_app.startup['error']}")
+        rag.chain = rag.create_chain(persist_dir)
+        results["startup_ms"] = {k: v * 1000 for k, v in flask_app.startup["timings"].items()}
+
+        queries = make_queries(args.queries)
+        print("Benchmarking query embedding and retrieval...", file=sys.stderr)
+        results["query_embedding"] = bench_embedding(my_langchain.embeddings, queries)
+        results["retrieval"] = bench_retrieval(rag.chain, queries)
+
+        server, base_url = serve(flask_app.app)
+        results["query"] = []
+        try:
+            for concurrency in args.concurrency:
+                print(f"Benchmarking /query at concurrency {concurrency}...", file=sys.stderr)
+                rag.llm.calls = 0
+                stats = bench_http(base_url, make_queries(args.requests, seed=concurrency), concurrency)
+                stats["llm_calls"] = rag.llm.calls
+                results["query"].append(stats)
+        finally:
+            server.shutdown()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    out = json.dumps(results, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Tail latency of the LLM client against a flaky local OpenAI-compatible server.
+
+    python benchmarks/llm_tail_latency.py --requests 300 --concurrency 16 --rate-limit 0.1 --slow 0.05
+    python benchmarks/llm_tail_latency.py --serve --port 8099   # only run the stand-in server
+
+The stand-in server answers /v1/chat/completions (and streams with "stream": true). A
+--rate-limit fraction of requests get 429 with Retry-After, a --slow fraction take
+--slow-latency instead of --latency. Each client configuration runs against the same
+server: no retries, retries, and retries plus hedging.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage
+
+from common import percentile
+from llm_backend import LLMError, OpenAICompatibleChat
+
+
+def stand_in_server(port, latency, slow, slow_latency, rate_limit, errors, seed=0):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    counts = {"requests": 0, "429": 0, "500": 0, "slow": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, body, headers=()):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            with lock:
+                counts["requests"] += 1
+                roll = rng.random()
+                delay = slow_latency if rng.random() < slow else latency
+                counts["slow"] += delay == slow_latency
+            if not self.path.endswith("/chat/completions"):
+                return self.send_json(404, {"error": {"message": "not found"}})
+            if roll < rate_limit:
+                with lock:
+                    counts["429"] += 1
+                return self.send_json(429, {"error": {"message": "rate limited"}}, [("Retry-After", "0.05")])
+            if roll < rate_limit + errors:
+                with lock:
+                    counts["500"] += 1
+                return self.send_json(500, {"error": {"message": "upstream error"}})
+            time.sleep(delay)
+            prompt = " ".join(m["content"] for m in body["messages"])
+            answer = f"echo {len(prompt)} chars"
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in answer.split(" ") + [None]:
+                    data = "[DONE]" if token is None else json.dumps(
+                        {"choices": [{"delta": {"content": token + " "}}]})
+                    line = f"data: {data}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            self.send_json(200, {
+                "model": body.get("model"),
+                "choices": [{"message": {"role": "assistant", "content": answer}}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 3,
+                          "total_tokens": len(prompt) // 4 + 3},
+            })
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # clients dropping idle keep-alive connections are expected here
+            pass
+
+    server = Server(("127.0.0.1", port), Handler)
+    return server, counts
+
+
+def run(llm, requests, concurrency):
+    latencies = []
+    failures = []
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            llm.invoke([HumanMessage(content=f"question {i}")])
+        except LLMError as e:
+            failures.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "qps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "failed": len(failures),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--serve", action="store_true", help="only run the stand-in server")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="normal response time")
+    parser.add_argument("--slow", type=float, default=0.05, help="fraction of slow responses")
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--rate-limit", type=float, default=0.1, help="fraction of 429 responses")
+    parser.add_argument("--errors", type=float, default=0.02, help="fraction of 500 responses")
+    parser.add_argument("--hedge-after", type=float, default=0.15)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    server, counts = stand_in_server(args.port, args.latency, args.slow, args.slow_latency,
+                                     args.rate_limit, args.errors)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    if args.serve:
+        print(f"Serving an OpenAI-compatible stand-in at {base_url}")
+        server.serve_forever()
+        return
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    configs = [
+        ("no retries", dict(max_retries=0)),
+        ("retries", dict(max_retries=3)),
+        ("retries + hedging", dict(max_retries=3, hedge_after=args.hedge_after)),
+    ]
+    results = []
+    print(f"{'client':<18} {'qps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>7} {'upstream':>9}")
+    for name, config in configs:
+        llm = OpenAICompatibleChat(base_url=base_url, model="stand-in", timeout=10.0,
+                                   backoff_base=0.05, pool_size=2 * args.concurrency, **config)
+        before = counts["requests"]
+        stats = run(llm, args.requests, args.concurrency)
+        stats.update(client=name, upstream_requests=counts["requests"] - before)
+        results.append(stats)
+        print(f"{name:<18} {stats['qps']:>7.1f} {stats['p50_ms']:>8.0f} {stats['p95_ms']:>8.0f} "
+              f"{stats['p99_ms']:>8.0f} {stats['failed']:>7} {stats['upstream_requests']:>9}")
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
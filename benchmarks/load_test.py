@@ -0,0 +1,87 @@
+"""Throughput vs. concurrency for the sync and async serving paths against a stub LLM.
+
+    python benchmarks/load_test.py --requests 200 --concurrency 1 4 16 64 --duplicates 0.5
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnablePassthrough
+
+import rag
+from async_runner import AsyncRunner
+from common import percentile
+from stub_llm import StubChatModel
+
+
+def run(generate, queries, concurrency):
+    latencies = []
+
+    def one(q):
+        start = time.perf_counter()
+        generate(q)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    elapsed = time.perf_counter() - start
+    return {
+        "qps": len(queries) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--duplicates", type=float, default=0.5,
+                        help="fraction of requests repeating another request's query")
+    parser.add_argument("--max-concurrency", type=int, default=rag.max_concurrent_llm,
+                        help="async path upstream concurrency limit")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM time to first token")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    llm = StubChatModel(latency=args.latency)
+    prompt = ChatPromptTemplate.from_template("Context: {context}\nQuestion: {question}")
+    rag.chain = {"context": lambda q: "", "question": RunnablePassthrough()} | prompt | llm | StrOutputParser()
+    rag.answer_cache_enabled = False
+
+    distinct = max(1, int(args.requests * (1 - args.duplicates)))
+    random.seed(0)
+    queries = [f"question {random.randrange(distinct)} about consensus" for _ in range(args.requests)]
+
+    results = []
+    print(f"{'mode':<6} {'conc':>5} {'qps':>8} {'p50 ms':>8} {'p95 ms':>8} {'llm calls':>10}")
+    for concurrency in args.concurrency:
+        for mode in ("sync", "async"):
+            llm.calls = 0
+            if mode == "async":
+                rag.runner = AsyncRunner(args.max_concurrency)
+                stats = run(rag.generate_async, queries, concurrency)
+            else:
+                stats = run(rag.generate, queries, concurrency)
+            stats.update(mode=mode, concurrency=concurrency, llm_calls=llm.calls)
+            results.append(stats)
+            print(f"{mode:<6} {concurrency:>5} {stats['qps']:>8.1f} {stats['p50_ms']:>8.0f} "
+                  f"{stats['p95_ms']:>8.0f} {stats['llm_calls']:>10}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Memory and throughput of preforked workers against the same number of independent processes.
+
+    python benchmarks/prefork.py --workers 4 --threads 8 --requests 400 --concurrency 32
+
+Both setups serve the current db/latest_db.txt index with the stub LLM. Build it with
+`python my_langchain.py --backend numpy` to share the memory-mapped matrix as well. PSS
+(proportional set size) charges each shared page to its sharers equally, so the PSS sum
+is the real memory cost; RSS counts shared pages in full for every process.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import itertools
+import argparse
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import percentile
+from serve import rss_mb
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(workers, threads, port, env):
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "serve.py"), "--port", str(port),
+                             "--workers", str(workers), "--threads", str(threads)],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=2) as resp:
+                if resp.status == 200:
+                    return proc
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("serve.py did not become ready")
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def query(url, q):
+    body = json.dumps({"query": q}).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def load(ports, requests, concurrency):
+    urls = itertools.cycle([f"http://127.0.0.1:{port}/query" for port in ports])
+    jobs = [(next(urls), f"How does consensus work in shard {i % 50}?") for i in range(requests)]
+    latencies = []
+    errors = []
+
+    def one(job):
+        start = time.perf_counter()
+        if query(*job) != 200:
+            errors.append(job)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, jobs))
+    elapsed = time.perf_counter() - start
+    return {"qps": requests / elapsed, "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000, "errors": len(errors)}
+
+
+def measure(name, procs, pids, ports, args):
+    started = time.perf_counter()
+    stats = load(ports, args.requests, args.concurrency)
+    memory = [dict(zip(("rss_mb", "pss_mb"), rss_mb(pid)), pid=pid) for pid in pids]
+    stats.update(setup=name, processes=memory,
+                 total_rss_mb=sum(m["rss_mb"] for m in memory),
+                 total_pss_mb=sum(m["pss_mb"] for m in memory),
+                 seconds=time.perf_counter() - started)
+    for proc in procs:
+        proc.send_signal(signal.SIGTERM)
+    for proc in procs:
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM time to first token")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, LLM_BACKEND="stub", STUB_LLM_LATENCY=str(args.llm_latency),
+               ANSWER_CACHE_ENABLED="0", INDEX_WATCH_INTERVAL="0")
+    results = []
+
+    port = free_port()
+    master = start(args.workers, args.threads, port, env)
+    results.append(measure("prefork", [master], [master.pid] + children(master.pid), [port], args))
+
+    ports = [free_port() for _ in range(args.workers)]
+    procs = [start(0, args.threads, p, env) for p in ports]
+    results.append(measure("independent", procs, [p.pid for p in procs], ports, args))
+
+    print(f"{args.workers} workers x {args.threads} threads, {args.requests} requests at concurrency {args.concurrency}")
+    print(f"{'setup':<12} {'qps':>7} {'p50 ms':>8} {'p99 ms':>8} {'procs':>6} {'RSS MB':>8} {'PSS MB':>8} {'RSS/proc':>9}")
+    for r in results:
+        n = len(r["processes"])
+        print(f"{r['setup']:<12} {r['qps']:>7.1f} {r['p50_ms']:>8.0f} {r['p99_ms']:>8.0f} {n:>6} "
+              f"{r['total_rss_mb']:>8.0f} {r['total_pss_mb']:>8.0f} {r['total_rss_mb'] / n:>9.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
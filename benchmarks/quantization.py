@@ -0,0 +1,139 @@
+"""Recall@k, latency and memory of int8 / binary quantized search against exact float search.
+
+bytes/vec is what one scan reads per vector. disk MB is the whole index, the float32 rows
+kept for rescoring included. mapped MB is how much of the index files the searches left
+resident in this process (from /proc/self/smaps, Linux only).
+
+    python benchmarks/quantization.py --vectors 100000 --k 4
+    python benchmarks/quantization.py --snapshot db/chroma_1712345678   # vectors from a numpy snapshot
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from vector_index import VECTORS_FILE, VECTORS_META, NumpyVectorStore, VectorIndexWriter
+
+DIM = 384
+
+
+def synthetic(n, clusters=200, seed=0):
+    """Clustered unit vectors, closer to sentence embeddings than isotropic noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_snapshot(path):
+    with open(os.path.join(path, VECTORS_META)) as f:
+        meta = json.load(f)
+    return np.fromfile(os.path.join(path, VECTORS_FILE), dtype=meta["dtype"]).reshape(
+        meta["count"], meta["dim"]).astype(np.float32)
+
+
+def write(root, name, vectors, quantization, batch=10000):
+    path = os.path.join(root, name)
+    writer = VectorIndexWriter(path, "float32", quantization)
+    for start in range(0, len(vectors), batch):
+        part = vectors[start:start + batch]
+        ids = [str(i) for i in range(start, start + len(part))]
+        writer.add([Document(page_content=i) for i in ids], ids, part)
+    writer.close()
+    return path
+
+
+def disk_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 2**20
+
+
+def mapped_mb(path):
+    """Resident size of this process's mappings of files under path"""
+    total, inside = 0, False
+    try:
+        with open("/proc/self/smaps") as f:
+            for line in f:
+                fields = line.split()
+                if "-" in fields[0] and len(fields) >= 5:
+                    inside = len(fields) >= 6 and fields[5].startswith(path)
+                elif inside and fields[0] == "Rss:":
+                    total += int(fields[1])
+    except OSError:
+        return None
+    return total / 1024
+
+
+def measure(store, probes, k):
+    results = []
+    latencies = []
+    for probe in probes:
+        t = time.perf_counter()
+        rows, _ = store.search(probe, k)
+        latencies.append(time.perf_counter() - t)
+        results.append(set(rows))
+    latencies.sort()
+    return results, latencies[len(latencies) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--snapshot", help="numpy snapshot directory to take vectors from")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--oversample", type=int, nargs="+", default=[1, 4, 10, 50])
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    vectors = load_snapshot(args.snapshot) if args.snapshot else synthetic(args.vectors)
+    dim = vectors.shape[1]
+    rng = np.random.default_rng(1)
+    probes = vectors[rng.integers(0, len(vectors), args.queries)]
+    probes = probes + 0.05 * rng.standard_normal(probes.shape).astype(np.float32)
+
+    root = tempfile.mkdtemp(prefix="quantization_")
+    try:
+        path = write(root, "float", vectors, None)
+        store = NumpyVectorStore(path, None)
+        baseline, baseline_ms = measure(store, probes, args.k)
+        results = [{"mode": "float32", "oversample": None, "recall": 1.0, "p50_ms": baseline_ms,
+                    "scan_bytes_per_vector": dim * 4, "reduction": 1.0, "disk_mb": disk_mb(path),
+                    "mapped_mb": mapped_mb(path)}]
+        del store
+        for quantization, scan_bytes in (("int8", dim + 4), ("binary", (dim + 7) // 8)):
+            path = write(root, quantization, vectors, quantization)
+            for oversample in args.oversample:
+                store = NumpyVectorStore(path, None, oversample=oversample)
+                found, ms = measure(store, probes, args.k)
+                mapped = mapped_mb(path)
+                del store
+                recall = float(np.mean([len(f & b) / len(b) for f, b in zip(found, baseline)]))
+                results.append({"mode": quantization, "oversample": oversample, "recall": recall, "p50_ms": ms,
+                                "scan_bytes_per_vector": scan_bytes, "reduction": dim * 4 / scan_bytes,
+                                "disk_mb": disk_mb(path), "mapped_mb": mapped})
+
+        print(f"{len(vectors)} vectors, {dim} dims, recall@{args.k} against exact float32 search")
+        print(f"{'mode':<8} {'oversample':>10} {'recall':>8} {'p50 ms':>8} {'bytes/vec':>10} {'reduction':>10} "
+              f"{'disk MB':>8} {'mapped MB':>10}")
+        for r in results:
+            print(f"{r['mode']:<8} {str(r['oversample'] or '-'):>10} {r['recall']:>8.3f} {r['p50_ms']:>8.2f} "
+                  f"{r['scan_bytes_per_vector']:>10} {r['reduction']:>9.1f}x {r['disk_mb']:>8.1f} "
+                  f"{'-' if r['mapped_mb'] is None else format(r['mapped_mb'], '.1f'):>10}")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Search latency of one store holding every topic against centroid-routed topic shards.
+
+    python benchmarks/sharding.py --shards 3 --vectors 60000 --queries 300
+
+Vectors are clustered by topic, so each shard has a clear centroid. Queries are drawn
+near one topic; the report shows per-query latency and how often the router picked the
+query's own shard.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from relevance import ScoredRetriever
+from sharding import ShardedRetriever, ShardRouter, store_centroid
+from vector_index import NumpyVectorStore, VectorIndexWriter
+
+DIM = 384
+
+
+class QueryVectors(Embeddings):
+    """Queries are the text form of an index into a prepared matrix of query vectors"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors[int(text)].tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def write_store(path, vectors, topic):
+    writer = VectorIndexWriter(path)
+    for start in range(0, len(vectors), 4096):
+        block = vectors[start:start + 4096]
+        ids = [f"{topic}-{i}" for i in range(start, start + len(block))]
+        writer.add([Document(page_content=i, metadata={"source": f"{topic}.txt"}) for i in ids], ids, block)
+    writer.close()
+
+
+def timed(retriever, n):
+    latencies = []
+    picked = []
+    for i in range(n):
+        start = time.perf_counter()
+        docs = retriever.invoke(str(i))
+        latencies.append(time.perf_counter() - start)
+        picked.append(docs[0].metadata.get("shard") if docs else None)
+    latencies.sort()
+    return latencies, picked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--vectors", type=int, default=60000, help="total vectors across all shards")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--spread", type=float, default=0.6, help="noise around each topic center")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((args.shards, DIM)).astype(np.float32)
+    per_shard = args.vectors // args.shards
+    topics = [f"topic{i}" for i in range(args.shards)]
+    query_topics = rng.integers(0, args.shards, args.queries)
+    queries = centers[query_topics] + args.spread * rng.standard_normal((args.queries, DIM)).astype(np.float32)
+    embeddings = QueryVectors(queries)
+
+    root = tempfile.mkdtemp(prefix="sharding_bench_")
+    try:
+        shards = {}
+        everything = []
+        for i, topic in enumerate(topics):
+            vectors = centers[i] + args.spread * rng.standard_normal((per_shard, DIM)).astype(np.float32)
+            write_store(os.path.join(root, topic), vectors, topic)
+            everything.append(vectors)
+        write_store(os.path.join(root, "all"), np.concatenate(everything), "all")
+
+        single = ScoredRetriever(vectorstore=NumpyVectorStore(os.path.join(root, "all"), embeddings), k=4)
+        retrievers = {}
+        for topic in topics:
+            store = NumpyVectorStore(os.path.join(root, topic), embeddings)
+            retrievers[topic] = ScoredRetriever(vectorstore=store, k=4)
+            shards[topic] = {"centroid": store_centroid(store)}
+        results = []
+        for mode, max_shards in (("all", args.shards), ("centroid", 1)):
+            router = ShardRouter(shards, mode=mode, max_shards=max_shards)
+            sharded = ShardedRetriever(retrievers=retrievers, router=router, embeddings=embeddings, k=4,
+                                       pool=ThreadPoolExecutor(max_workers=max(4, 2 * args.shards)))
+            latencies, picked = timed(sharded, args.queries)
+            hit = np.mean([p == topics[t] for p, t in zip(picked, query_topics)])
+            results.append({"setup": f"shards ({mode})", "p50_ms": latencies[len(latencies) // 2] * 1000,
+                             "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000, "routing_accuracy": float(hit),
+                             "vectors_scanned": per_shard * max_shards})
+        latencies, _ = timed(single, args.queries)
+        results.insert(0, {"setup": "single store", "p50_ms": latencies[len(latencies) // 2] * 1000,
+                           "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000, "routing_accuracy": None,
+                           "vectors_scanned": per_shard * args.shards})
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{args.shards} shards x {per_shard} vectors, {args.queries} queries")
+    print(f"{'setup':<18} {'scanned':>9} {'p50 ms':>8} {'p99 ms':>8} {'routed to own shard':>20}")
+    for r in results:
+        accuracy = "" if r["routing_accuracy"] is None else f"{r['routing_accuracy'] * 100:.1f}%"
+        print(f"{r['setup']:<18} {r['vectors_scanned']:>9} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {accuracy:>20}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Chunking throughput of RecursiveCharacterTextSplitter against the offset-based splitter.
+
+    python benchmarks/splitting.py --books 8 --mb 4
+    python benchmarks/splitting.py --layout flat        # no newlines, like some PDF extractions
+    python benchmarks/splitting.py --dir books          # real files instead of synthetic ones
+
+Every mode must produce exactly the same chunk texts; the run fails otherwise.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from loaders import discover_files, load_file
+from splitter import FastSplitter, iter_split
+
+WORDS = ("block chain hash nonce miner validator stake slot epoch leader ledger proof history "
+         "consensus fork reorg mempool gas fee account contract state root signature").split()
+
+
+LAYOUTS = {"prose": ("\n\n", "\n"), "lines": ("\n", "\n"), "flat": (" ", " ")}
+
+
+def synthetic_book(mb, seed, layout="prose"):
+    """Prose-like text: words, sentences, lines and paragraphs of varying length"""
+    paragraph_sep, line_sep = LAYOUTS[layout]
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < mb * 1e6:
+        paragraph = []
+        for _ in range(rng.randint(1, 12)):
+            line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+            paragraph.append(line[0].upper() + line[1:] + ".")
+        text = line_sep.join(paragraph)
+        parts.append(text)
+        size += len(text) + 2
+    return paragraph_sep.join(parts)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", help="directory of books to split instead of synthetic text")
+    parser.add_argument("--books", type=int, default=8, help="synthetic books")
+    parser.add_argument("--mb", type=float, default=4, help="size of each synthetic book")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="prose",
+                        help="synthetic books: paragraphs, single newlines only, or no newlines")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.dir:
+        docs = [d for name in discover_files(args.dir) for d in load_file(os.path.join(args.dir, name))[0]]
+    else:
+        docs = [Document(page_content=synthetic_book(args.mb, i, args.layout), metadata={"source": f"book{i}.txt"})
+                for i in range(args.books)]
+    mb = sum(len(d.page_content) for d in docs) / 1e6
+    seps = ["\n\n", "\n", " ", ""]
+
+    reference = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, separators=seps)
+    fast = FastSplitter(1000, 200, seps)
+    modes = [
+        ("recursive", lambda: reference.split_documents(docs)),
+        ("offsets", lambda: fast.split_documents(docs)),
+        (f"offsets x{args.workers}", lambda: list(iter_split(docs, fast, args.workers))),
+    ]
+    results = []
+    expected = None
+    print(f"{len(docs)} documents, {mb:.1f} MB")
+    print(f"{'mode':<14} {'chunks':>8} {'seconds':>8} {'MB/s':>8} {'speedup':>8}")
+    for name, run in modes:
+        chunks, seconds = timed(run)
+        texts = [c.page_content for c in chunks]
+        if expected is None:
+            expected = texts
+        elif texts != expected:
+            sys.exit(f"{name} produced different chunks than the recursive splitter")
+        results.append({"mode": name, "chunks": len(chunks), "seconds": seconds, "mb_per_s": mb / seconds,
+                        "speedup": results[0]["seconds"] / seconds if results else 1.0})
+        r = results[-1]
+        print(f"{name:<14} {r['chunks']:>8} {r['seconds']:>8.2f} {r['mb_per_s']:>8.1f} {r['speedup']:>7.1f}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Open time, query latency and RSS of the Chroma and numpy memmap vector backends.
+
+    python benchmarks/vector_backends.py --vectors 50000 --queries 200
+
+Each backend is measured in its own subprocess so RSS numbers are not mixed.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from vector_index import VectorIndexWriter
+
+DIM = 384
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+def build(root, n, batch):
+    rng = np.random.default_rng(0)
+    import chromadb
+    client = chromadb.PersistentClient(path=os.path.join(root, "chroma"))
+    collection = client.get_or_create_collection("langchain")
+    writers = {dtype: VectorIndexWriter(os.path.join(root, dtype), dtype) for dtype in ("float32", "float16")}
+    for start in range(0, n, batch):
+        vectors = rng.standard_normal((min(batch, n - start), DIM)).astype(np.float32)
+        ids = [f"doc-{i}" for i in range(start, start + len(vectors))]
+        texts = [f"chunk {i}" for i in range(start, start + len(vectors))]
+        collection.add(ids=ids, embeddings=vectors.tolist(), documents=texts,
+                       metadatas=[{"source": "synthetic"}] * len(ids))
+        docs = [Document(page_content=t, metadata={"source": "synthetic"}) for t in texts]
+        for writer in writers.values():
+            writer.add(docs, ids, vectors)
+    for writer in writers.values():
+        writer.close()
+
+
+def child(backend, path, queries, k):
+    rng = np.random.default_rng(1)
+    probes = rng.standard_normal((queries, DIM)).astype(np.float32).tolist()
+    base = rss_mb()
+    start = time.perf_counter()
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        store = Chroma(persist_directory=path)
+    else:
+        from vector_index import NumpyVectorStore
+        store = NumpyVectorStore(path, None)
+    store.similarity_search_by_vector(probes[0], k=k)
+    open_s = time.perf_counter() - start
+    latencies = []
+    for probe in probes:
+        t = time.perf_counter()
+        store.similarity_search_by_vector(probe, k=k)
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+    print(json.dumps({
+        "backend": backend,
+        "open_ms": open_s * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "rss_mb": rss_mb(),
+        "rss_delta_mb": rss_mb() - base,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--child", nargs=2, metavar=("BACKEND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.queries, args.k)
+        return
+
+    root = tempfile.mkdtemp(prefix="vector_backends_")
+    try:
+        print(f"Building {args.vectors} x {DIM} synthetic vectors in {root}...")
+        build(root, args.vectors, args.batch)
+        results = []
+        print(f"{'backend':<10} {'open ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8} {'+RSS MB':>8}")
+        for backend, path in [("chroma", "chroma"), ("numpy", "float32"), ("numpy16", "float16")]:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--queries", str(args.queries), "--k", str(args.k),
+                 "--child", "chroma" if backend == "chroma" else "numpy", os.path.join(root, path)],
+                check=True, capture_output=True, text=True,
+            ).stdout.strip().splitlines()[-1]
+            stats = dict(json.loads(out), backend=backend)
+            results.append(stats)
+            print(f"{backend:<10} {stats['open_ms']:>9.1f} {stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} "
+                  f"{stats['rss_mb']:>8.0f} {stats['rss_delta_mb']:>8.0f}")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import os
+import re
+import math
+import json
+import sqlite3
+import threading
+from array import array
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from relevance import BEST_SCORE_KEY, KEYWORD_SCORE_KEY, SCORE_KEY
+
+BM25_NAME = "bm25.sqlite"
+# postings (idx, tf pairs) buffered in memory before they are spilled to the index file
+FLUSH_POSTINGS = 1 << 20
+# query terms found in more than this share of chunks ("the", "is") are not scored; their
+# idf is close to zero but their postings cover most of the corpus
+MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", "0.5"))
+# keeps tickers, version numbers and ids like "eip-1559" or "erc20" as single terms
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Writer:
+    """Builds a BM25 inverted index (postings + doc lengths) into a SQLite file.
+
+    Postings are buffered up to FLUSH_POSTINGS, spilled as one partial list per term, and
+    joined into each term's full list on close, so memory does not grow with the corpus.
+    """
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE docs (idx INTEGER PRIMARY KEY, id TEXT, text TEXT, metadata TEXT)")
+        self.conn.execute("CREATE TABLE terms (term TEXT PRIMARY KEY, df INTEGER, postings BLOB)")
+        self.conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value BLOB)")
+        self.conn.execute("CREATE TABLE pending (term TEXT, postings BLOB)")
+        self.postings = defaultdict(lambda: array("I"))
+        self.buffered = 0
+        self.lengths = array("I")
+
+    def add(self, docs, ids):
+        rows = []
+        for doc, doc_id in zip(docs, ids):
+            idx = len(self.lengths)
+            tokens = tokenize(doc.page_content)
+            self.lengths.append(len(tokens))
+            counts = Counter(tokens)
+            for term, tf in counts.items():
+                self.postings[term].extend((idx, tf))
+            self.buffered += len(counts)
+            rows.append((idx, doc_id, doc.page_content, json.dumps(doc.metadata)))
+        self.conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+        if self.buffered >= FLUSH_POSTINGS:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany("INSERT INTO pending VALUES (?, ?)",
+                              ((t, p.tobytes()) for t, p in self.postings.items()))
+        self.postings.clear()
+        self.buffered = 0
+
+    def update_metadata(self, updates):
+        """Merge {idx: metadata} into docs already added"""
+        for idx, meta in updates.items():
+            row = self.conn.execute("SELECT metadata FROM docs WHERE idx = ?", (idx,)).fetchone()
+            if row:
+                self.conn.execute("UPDATE docs SET metadata = ? WHERE idx = ?",
+                                  (json.dumps(dict(json.loads(row[0]), **meta)), idx))
+
+    def grouped_postings(self):
+        """(term, df, postings blob) per term; spills are joined in write order, which is idx order"""
+        term, postings = None, array("I")
+        for t, blob in self.conn.execute("SELECT term, postings FROM pending ORDER BY term, rowid"):
+            if t != term:
+                if term is not None:
+                    yield term, len(postings) // 2, postings.tobytes()
+                term, postings = t, array("I")
+            postings.frombytes(blob)
+        if term is not None:
+            yield term, len(postings) // 2, postings.tobytes()
+
+    def close(self):
+        self.flush()
+        # lets the grouped read walk pending in term order instead of sorting it in one go
+        self.conn.execute("CREATE INDEX pending_term ON pending (term)")
+        self.conn.executemany("INSERT INTO terms VALUES (?, ?, ?)", self.grouped_postings())
+        self.conn.execute("DROP TABLE pending")
+        terms = self.conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+        total = sum(self.lengths)
+        self.conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("n", len(self.lengths)),
+            ("avgdl", total / len(self.lengths) if self.lengths else 0.0),
+            ("lengths", self.lengths.tobytes()),
+        ])
+        self.conn.commit()
+        # give back the pages the pending rows used
+        self.conn.execute("VACUUM")
+        self.conn.close()
+        print(f"---created bm25 index: {len(self.lengths)} docs, {terms} terms---")
+
+
+class BM25Index:
+    """Read side of the BM25 index.
+
+    Nothing is read at construction; each search touches only the query terms' postings,
+    so opening cost does not grow with the corpus. Postings are scored with numpy, and
+    terms above MAX_DF_RATIO are skipped unless the query has nothing else.
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.conn = None
+        self.lengths = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        if self.conn is None:
+            with self.lock:
+                if self.conn is None:
+                    conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+                    conn.execute("PRAGMA mmap_size=268435456")
+                    meta = dict(conn.execute("SELECT key, value FROM meta"))
+                    self.n = int(meta["n"])
+                    self.avgdl = float(meta["avgdl"]) or 1.0
+                    self.lengths = np.frombuffer(meta["lengths"], dtype=np.uint32)
+                    self.conn = conn
+        return self.conn
+
+    def idf(self, df):
+        return math.log(1 + (self.n - df + 0.5) / (df + 0.5))
+
+    def search(self, query, k=4, normalized=False):
+        """Return up to k (Document, score) pairs, best first.
+
+        normalized divides each score by the idf summed over every query term, absent ones
+        included, and caps it at 1, so a match on "the" alone scores near 0.
+        """
+        conn = self.open()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self.lock:
+            dfs = dict(conn.execute(f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(terms))})",
+                                    terms).fetchall())
+        scored = [t for t, df in dfs.items() if df <= MAX_DF_RATIO * self.n] or list(dfs)
+        if not scored:
+            return []
+        with self.lock:
+            rows = conn.execute(
+                f"SELECT df, postings FROM terms WHERE term IN ({','.join('?' * len(scored))})", scored
+            ).fetchall()
+        k1, b, avgdl = self.k1, self.b, self.avgdl
+        ids, parts = [], []
+        for df, blob in rows:
+            idf = self.idf(df)
+            postings = np.frombuffer(blob, dtype=np.uint32).reshape(-1, 2)
+            idx, tf = postings[:, 0], postings[:, 1].astype(np.float64)
+            ids.append(idx)
+            parts.append(idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * self.lengths[idx] / avgdl)))
+        # chunks matching several terms are summed; cost follows the postings read, not the corpus
+        unique, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(parts))
+        candidates = np.flatnonzero(totals >= -np.partition(-totals, k - 1)[k - 1]) \
+            if len(totals) > k else np.arange(len(totals))
+        best = candidates[np.lexsort((candidates, -totals[candidates]))][:k]
+        top = [(int(unique[i]), float(totals[i])) for i in best]
+        if normalized:
+            weight = sum(self.idf(dfs.get(t, 0)) for t in terms)
+            top = [(idx, min(1.0, score / weight)) for idx, score in top]
+        with self.lock:
+            docs = {
+                idx: Document(page_content=text, metadata=json.loads(metadata), id=doc_id)
+                for idx, doc_id, text, metadata in conn.execute(
+                    f"SELECT idx, id, text, metadata FROM docs WHERE idx IN ({','.join('?' * len(top))})",
+                    [idx for idx, _ in top],
+                )
+            }
+        return [(docs[idx], score) for idx, score in top]
+
+
+def doc_key(doc):
+    return doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings, k=4, c=60):
+    """Merge ranked Document lists by summing 1 / (c + rank) per list"""
+    scores = defaultdict(float)
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc_key(doc)
+            scores[key] += 1.0 / (c + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+
+def keyword_hits(index, query, k):
+    hits = index.search(query, k, normalized=True)
+    for doc, score in hits:
+        doc.metadata[KEYWORD_SCORE_KEY] = score
+    return [doc for doc, _ in hits]
+
+
+class KeywordRetriever(BaseRetriever):
+    """Keyword-only retrieval from a persisted BM25Index"""
+
+    index: BM25Index
+    k: int = 4
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        return keyword_hits(self.index, query, self.k)
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses dense vector hits and BM25 hits with reciprocal rank fusion.
+
+    Fused hits carry the best dense score seen before fusion, and chunks BM25 also found
+    carry their keyword score, so the relevance gate does not depend on what fusion kept.
+    """
+
+    vector_retriever: BaseRetriever
+    index: BM25Index
+    k: int = 4
+    fetch_k: int = 10
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        keyword = keyword_hits(self.index, query, self.fetch_k)
+        dense = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        keyword_scores = {doc_key(d): d.metadata[KEYWORD_SCORE_KEY] for d in keyword}
+        scores = [d.metadata[SCORE_KEY] for d in dense if SCORE_KEY in d.metadata]
+        stamp = {BEST_SCORE_KEY: max(scores)} if scores else {}
+        fused = []
+        for doc in reciprocal_rank_fusion([dense, keyword], self.k):
+            extra = dict(stamp)
+            if doc_key(doc) in keyword_scores:
+                extra[KEYWORD_SCORE_KEY] = keyword_scores[doc_key(doc)]
+            fused.append(doc.model_copy(update={"metadata": dict(doc.metadata, **extra)}))
+        return fused
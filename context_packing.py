@@ -0,0 +1,149 @@
+import os
+import re
+import threading
+
+# close enough to LLM tokenizers for budgeting English text, without a tokenizer dependency
+CHARS_PER_TOKEN = 4
+MIN_OVERLAP = 30
+# tokens of retrieved context per prompt, unless CONTEXT_TOKEN_BUDGET says otherwise
+DEFAULT_CONTEXT_BUDGET = 1200
+SENTENCE_RE = re.compile(r"((?<=[.!?])\s+|\n{2,})")
+
+
+def approx_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def overlap(a, b):
+    """Length of the longest suffix of a that is a prefix of b (at least MIN_OVERLAP), else 0"""
+    if len(b) < MIN_OVERLAP:
+        return 0
+    head = b[:MIN_OVERLAP]
+    start = a.find(head, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(head, start + 1)
+    return 0
+
+
+def merge_source(chunks):
+    """Merge one source's chunks into non-overlapping spans, keeping the best rank of each"""
+    if all("start_index" in c.metadata for c in chunks):
+        chunks = sorted(chunks, key=lambda c: c.metadata["start_index"])
+        spans = []
+        for c in chunks:
+            start = c.metadata["start_index"]
+            rank = c.metadata["_rank"]
+            if spans and start <= spans[-1]["end"]:
+                last = spans[-1]
+                cut = last["end"] - start
+                if cut < len(c.page_content):
+                    last["text"] += c.page_content[cut:]
+                    last["end"] = start + len(c.page_content)
+                last["rank"] = min(last["rank"], rank)
+            else:
+                spans.append({"text": c.page_content, "end": start + len(c.page_content), "rank": rank})
+        return [(s["rank"], s["text"]) for s in spans]
+
+    spans = []
+    for c in chunks:
+        text, rank = c.page_content, c.metadata["_rank"]
+        for span in spans:
+            if text in span["text"]:
+                break
+            if span["text"] in text:
+                span["text"] = text
+                break
+            n = overlap(span["text"], text)
+            if n:
+                span["text"] += text[n:]
+                break
+            n = overlap(text, span["text"])
+            if n:
+                span["text"] = text + span["text"][n:]
+                break
+        else:
+            spans.append({"text": text, "rank": rank})
+            continue
+        span["rank"] = min(span["rank"], rank)
+    return [(s["rank"], s["text"]) for s in spans]
+
+
+def dedupe_sentences(text, seen):
+    """Drop sentences already in `seen`, keeping the original separators of the rest"""
+    parts = SENTENCE_RE.split(text)
+    kept = []
+    for i in range(0, len(parts), 2):
+        sentence = parts[i]
+        key = " ".join(sentence.lower().split())
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        kept.append(sentence + (parts[i + 1] if i + 1 < len(parts) else ""))
+    return "".join(kept).strip()
+
+
+def truncate_to_tokens(text, tokens):
+    """Cut text to about `tokens` tokens, preferring the last sentence end inside the limit"""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind("\n"))
+    return cut[:end + 1] if end > limit // 2 else cut
+
+
+class ContextPacker:
+    """Turns retrieved chunks into one prompt context string within a token budget.
+
+    Overlapping or adjacent chunks from the same source and page are merged, sentences already
+    included are dropped, and spans are packed in retrieval order until the budget is used.
+    """
+
+    def __init__(self, budget=DEFAULT_CONTEXT_BUDGET):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.stats = {"queries": 0, "tokens_before": 0, "tokens_after": 0}
+
+    def pack(self, docs):
+        by_source = {}
+        for rank, doc in enumerate(docs):
+            doc = doc.model_copy(update={"metadata": dict(doc.metadata, _rank=rank)})
+            # PDF pages share a source but count start_index from each page's start
+            key = (doc.metadata.get("source", ""), doc.metadata.get("page"))
+            by_source.setdefault(key, []).append(doc)
+        spans = []
+        for (source, _), chunks in by_source.items():
+            spans.extend((rank, source, text) for rank, text in merge_source(chunks))
+        spans.sort(key=lambda s: s[0])
+
+        seen = set()
+        blocks = []
+        remaining = self.budget
+        for _, source, text in spans:
+            text = dedupe_sentences(text, seen)
+            if not text:
+                continue
+            header = f"[source: {os.path.basename(source)}]\n" if source else ""
+            room = remaining - approx_tokens(header)
+            if room <= 0:
+                break
+            text = truncate_to_tokens(text, room)
+            blocks.append(header + text)
+            remaining -= approx_tokens(header + text)
+        context = "\n\n".join(blocks)
+
+        with self.lock:
+            self.stats["queries"] += 1
+            # the raw list of Documents is what used to be formatted into the prompt
+            self.stats["tokens_before"] += approx_tokens(str(docs))
+            self.stats["tokens_after"] += approx_tokens(context)
+        return context
+
+    def snapshot(self):
+        with self.lock:
+            q = self.stats["queries"] or 1
+            return dict(self.stats, budget=self.budget,
+                        avg_tokens_before=self.stats["tokens_before"] / q,
+                        avg_tokens_after=self.stats["tokens_after"] / q)
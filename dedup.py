@@ -0,0 +1,143 @@
+import os
+import time
+import zlib
+
+import numpy as np
+
+from bm25_index import tokenize
+
+# a good cut-off for repeated boilerplate; ingest only dedups when asked, since the filter
+# keeps every kept chunk's signature and band keys in memory (~2.9 KB per chunk)
+SIMILARITY = 0.8
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0"))
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+# provenance listed per kept chunk; the count keeps going past it
+MAX_SOURCES = 20
+MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def lsh_bands(num_perm, threshold):
+    """(bands, rows) whose collision threshold (1/bands)^(1/rows) is the largest one below threshold.
+
+    Leaning low catches more true duplicates; the extra candidates are rejected by comparing
+    full signatures.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows == 0 and (1 / (num_perm // rows)) ** (1 / rows) <= threshold:
+            best = (num_perm // rows, rows)
+    return best
+
+
+class NearDuplicateFilter:
+    """Drops chunks whose word-shingle Jaccard similarity to an earlier kept chunk reaches threshold.
+
+    Each chunk gets a MinHash signature; signatures are split into LSH bands, so a chunk is
+    only compared with kept chunks that share a band, keeping the pass roughly linear. The
+    first chunk of a group is kept and collects the sources of the ones dropped against it.
+    """
+
+    def __init__(self, threshold=SIMILARITY, num_perm=NUM_PERM, shingle=SHINGLE_WORDS, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: the high 32 bits of a * x + b, one (a, b) pair per permutation
+        self.a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self.mix = rng.integers(1, 2**63, shingle, dtype=np.uint64) | np.uint64(1)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = []
+        self.merged = {}
+        self.token_hashes = {}
+        self.seen = 0
+        self.dropped = 0
+        self.seconds = 0.0
+
+    def token_ids(self, text):
+        cache = self.token_hashes
+        if len(cache) > 1_000_000:
+            cache.clear()
+        ids = []
+        for token in tokenize(text):
+            h = cache.get(token)
+            if h is None:
+                h = cache[token] = zlib.crc32(token.encode("utf-8"))
+            ids.append(h)
+        return np.array(ids, dtype=np.uint64)
+
+    def signature(self, text):
+        """MinHash signature of the chunk's word shingles, or None if it has no words"""
+        ids = self.token_ids(text)
+        if not len(ids):
+            return None
+        k = min(self.shingle, len(ids))
+        n = len(ids) - k + 1
+        shingles = ids[:n] * self.mix[0]
+        for j in range(1, k):
+            shingles += ids[j:n + j] * self.mix[j]
+        shingles = np.unique(shingles >> np.uint64(32))
+        hashed = (self.a[:, None] * shingles[None, :] + self.b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def band_keys(self, sig):
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def check(self, chunk):
+        """Return the ordinal of the kept chunk this one duplicates, or None after keeping it.
+
+        Kept chunks are numbered 0, 1, 2... in the order they were seen.
+        """
+        start = time.perf_counter()
+        self.seen += 1
+        sig = self.signature(chunk.page_content)
+        if sig is None:
+            self.signatures.append(None)
+            self.seconds += time.perf_counter() - start
+            return None
+        keys = self.band_keys(sig)
+        candidates = {bucket[key] for bucket, key in zip(self.buckets, keys) if key in bucket}
+        best, best_score = None, self.threshold
+        for ordinal in candidates:
+            score = np.count_nonzero(self.signatures[ordinal] == sig) / self.num_perm
+            if score >= best_score:
+                best, best_score = ordinal, score
+        if best is not None:
+            self.dropped += 1
+            entry = self.merged.setdefault(best, [0, []])
+            entry[0] += 1
+            if len(entry[1]) < MAX_SOURCES:
+                entry[1].append(f"{chunk.metadata.get('source', '')}:{chunk.metadata.get('start_index', '')}")
+        else:
+            ordinal = len(self.signatures)
+            self.signatures.append(sig)
+            for bucket, key in zip(self.buckets, keys):
+                bucket.setdefault(key, ordinal)
+        self.seconds += time.perf_counter() - start
+        return best
+
+    def filter(self, chunks):
+        """Yield only the kept chunks; their provenance is available from provenance() afterwards"""
+        for chunk in chunks:
+            if self.check(chunk) is None:
+                yield chunk
+
+    def collapse(self, chunks):
+        """Kept chunks as a list, with provenance already merged into their metadata"""
+        kept = list(self.filter(chunks))
+        for ordinal, meta in self.provenance().items():
+            kept[ordinal].metadata.update(meta)
+        return kept
+
+    def provenance(self):
+        """{kept ordinal: metadata to merge} for every kept chunk that absorbed duplicates"""
+        return {ordinal: {"duplicates": count, "duplicate_sources": "; ".join(sources)}
+                for ordinal, (count, sources) in self.merged.items()}
+
+    def summary(self):
+        share = self.dropped / self.seen * 100 if self.seen else 0.0
+        return (f"{self.dropped} of {self.seen} chunks were near-duplicates ({share:.1f}%), "
+                f"{self.dropped} embeddings saved, {self.seconds:.2f}s "
+                f"(threshold {self.threshold}, {self.bands} bands x {self.rows} rows)")
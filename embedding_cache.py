@@ -0,0 +1,117 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an in-memory LRU in front of a SQLite vector store.
+
+    Vectors are keyed by model name + sha256 of the text, so identical chunks and
+    repeated queries never reach the model twice, across runs and processes.
+    """
+
+    def __init__(self, embeddings, model_name, path, max_memory_items=10000):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+        self.conn_pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def connection(self):
+        # sqlite connections must not cross a fork, so reopen per process
+        if self.conn is None or self.conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self.conn_pid = os.getpid()
+        return self.conn
+
+    def remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def lookup(self, keys):
+        found = {}
+        missing = []
+        for k in keys:
+            if k in self.memory:
+                self.memory.move_to_end(k)
+                found[k] = self.memory[k]
+            else:
+                missing.append(k)
+        conn = self.connection()
+        # stay well under SQLite's bound-parameter limit
+        for i in range(0, len(missing), 500):
+            part = missing[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for k, blob in rows:
+                vector = array("f", blob).tolist()
+                found[k] = vector
+                self.remember(k, vector)
+        return found
+
+    def store(self, items):
+        conn = self.connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(k, array("f", v).tobytes()) for k, v in items],
+        )
+        conn.commit()
+        for k, v in items:
+            self.remember(k, v)
+
+    def embed_keyed(self, keys, texts):
+        with self.lock:
+            found = self.lookup(list(dict.fromkeys(keys)))
+        todo = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in todo:
+                todo[k] = t
+        self.hits += len(texts) - len(todo)
+        self.misses += len(todo)
+        if todo:
+            # one model call for every text not already cached
+            vectors = self.embeddings.embed_documents(list(todo.values()))
+            items = list(zip(todo.keys(), vectors))
+            with self.lock:
+                self.store(items)
+            found.update(items)
+        return [found[k] for k in keys]
+
+    def embed_documents(self, texts):
+        return self.embed_keyed([self.key(t) for t in texts], texts)
+
+    def embed_queries(self, texts):
+        """Embed many queries in one model call, sharing embed_query's cache entries"""
+        return self.embed_keyed(["q:" + self.key(t) for t in texts], texts)
+
+    def embed_query(self, text):
+        k = "q:" + self.key(text)
+        with self.lock:
+            found = self.lookup([k])
+        if k in found:
+            self.hits += 1
+            return found[k]
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        with self.lock:
+            self.store([(k, vector)])
+        return vector
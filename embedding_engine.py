@@ -0,0 +1,103 @@
+import os
+import math
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_BATCH_SIZE = 64
+
+_model = None
+
+
+class LazyEmbeddings(Embeddings):
+    """Defers building the wrapped embeddings (and loading model weights) until first use"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.instance = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.instance is None:
+            with self.lock:
+                if self.instance is None:
+                    self.instance = self.factory()
+        return self.instance
+
+    def embed_documents(self, texts):
+        return self.get().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.get().embed_query(text)
+
+
+def _init_worker(model_name, threads):
+    global _model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    # each worker owns a model copy; split the cores between them instead of oversubscribing
+    torch.set_num_threads(threads)
+    _model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode(texts, batch_size):
+    return _model.encode(texts, batch_size=batch_size, show_progress_bar=False).tolist()
+
+
+class ParallelEmbeddings(Embeddings):
+    """Shards texts across CPU worker processes, each holding one copy of the model.
+
+    Texts are sorted by length before batching so every batch pads to a similar
+    length, then results are returned in the caller's order. Each call is split into at
+    least one batch per worker, so calls smaller than workers * batch_size use every worker.
+    """
+
+    def __init__(self, model_name, workers=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.model_name = model_name
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.batch_size = batch_size
+        self.pool = None
+        self.texts = 0
+        self.seconds = 0.0
+
+    def executor(self):
+        if self.pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, threads),
+            )
+        return self.pool
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        start = time.perf_counter()
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        size = max(1, min(self.batch_size, math.ceil(len(texts) / self.workers)))
+        batches = [order[i:i + size] for i in range(0, len(order), size)]
+        pool = self.executor()
+        results = pool.map(_encode, [[texts[i] for i in b] for b in batches], [self.batch_size] * len(batches))
+        vectors = [None] * len(texts)
+        for batch, encoded in zip(batches, results):
+            for i, vector in zip(batch, encoded):
+                vectors[i] = vector
+        self.texts += len(texts)
+        self.seconds += time.perf_counter() - start
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def throughput(self):
+        return self.texts / self.seconds if self.seconds else 0.0
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -0,0 +1,271 @@
+import time
+import threading
+import contextvars
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+from context_packing import approx_tokens
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+CHUNK_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+def label_text(labels):
+    return ",".join(f'{k}="{str(v)}"' for k, v in labels)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label set"""
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            series = self.series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in self.series.items():
+                for bound, n in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{{{label_text(key + (('le', bound),))}}} {n}")
+                lines.append(f"{self.name}_bucket{{{label_text(key + (('le', '+Inf'),))}}} {series['count']}")
+                labels = f"{{{label_text(key)}}}" if key else ""
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Counter:
+    """Prometheus-style monotonic counter, one series per label set"""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in self.series.items():
+                labels = f"{{{label_text(key)}}}" if key else ""
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Gauge:
+    """Prometheus-style gauge holding the latest value"""
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+
+stage_seconds = Histogram("rag_stage_seconds", "Time spent in each stage of answering a query",
+                          LATENCY_BUCKETS, ["stage"])
+retrieved_chunks = Histogram("rag_retrieved_chunks", "Chunks returned by the retriever per query",
+                             CHUNK_BUCKETS)
+llm_tokens = Histogram("rag_llm_tokens", "Prompt and completion tokens per LLM call",
+                       TOKEN_BUCKETS, ["kind"])
+errors = Counter("rag_errors_total", "Failed stages by exception class", ["stage", "error"])
+http_seconds = Histogram("rag_http_request_seconds", "HTTP request latency by route and status",
+                         LATENCY_BUCKETS, ["route", "status"])
+METRICS = [stage_seconds, retrieved_chunks, llm_tokens, errors, http_seconds]
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+class Trace(BaseCallbackHandler):
+    """Callback handler that times the retrieval, packing and LLM stages of chain runs.
+
+    Every finished stage is observed into the module histograms; the trace also keeps
+    per-stage totals for the request it belongs to (used for the Server-Timing header).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = {}
+        self.parents = {}
+        self.prompts = {}
+        self.timings = {}
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.chunks = None
+
+    def record(self, stage, seconds):
+        stage_seconds.observe(seconds, stage=stage)
+        with self.lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def begin(self, run_id, stage, parent_run_id=None):
+        with self.lock:
+            self.parents[run_id] = parent_run_id
+            # runs nested in a run of the same stage (sharded -> hybrid -> dense retrievers) are
+            # counted once, at the outermost; skipped runs stay in parents so the walk passes them
+            ancestor = parent_run_id
+            while ancestor in self.parents:
+                if ancestor in self.started and self.started[ancestor][0] == stage:
+                    return
+                ancestor = self.parents[ancestor]
+            self.started[run_id] = (stage, time.perf_counter())
+
+    def end(self, run_id):
+        with self.lock:
+            self.parents.pop(run_id, None)
+            entry = self.started.pop(run_id, None)
+        if entry is None:
+            return None
+        stage, start = entry
+        self.record(stage, time.perf_counter() - start)
+        return stage
+
+    def fail(self, run_id, error):
+        with self.lock:
+            self.parents.pop(run_id, None)
+            entry = self.started.pop(run_id, None)
+        if entry is not None:
+            errors.inc(stage=entry[0], error=type(error).__name__)
+
+    def on_retriever_start(self, serialized, query, *, run_id: UUID, parent_run_id=None, **kwargs):
+        self.begin(run_id, "retrieve", parent_run_id)
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs):
+        if self.end(run_id):
+            retrieved_chunks.observe(len(documents))
+            with self.lock:
+                self.chunks = (self.chunks or 0) + len(documents)
+
+    def on_retriever_error(self, error, *, run_id: UUID, **kwargs):
+        self.fail(run_id, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id=None, **kwargs):
+        if kwargs.get("name") == "pack":
+            self.begin(run_id, "pack", parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        self.end(run_id)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs):
+        self.fail(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id=None, **kwargs):
+        self.begin(run_id, "llm", parent_run_id)
+        with self.lock:
+            self.prompts[run_id] = sum(approx_tokens(str(m.content)) for batch in messages for m in batch)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        self.end(run_id)
+        with self.lock:
+            estimate = self.prompts.pop(run_id, 0)
+        prompt, completion = estimate, 0
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = usage or getattr(message, "usage_metadata", None)
+                completion += approx_tokens(generation.text)
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            prompt, completion = usage["input_tokens"], usage["output_tokens"]
+        elif token_usage:
+            prompt, completion = token_usage.get("prompt_tokens", prompt), token_usage.get("completion_tokens", completion)
+        llm_tokens.observe(prompt, kind="prompt")
+        llm_tokens.observe(completion, kind="completion")
+        with self.lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["completion"] += completion
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        with self.lock:
+            self.prompts.pop(run_id, None)
+        self.fail(run_id, error)
+
+    def merge(self, other):
+        """Add another trace's totals to this one; its metrics were already observed"""
+        with other.lock:
+            timings, tokens, chunks = dict(other.timings), dict(other.tokens), other.chunks
+        with self.lock:
+            for stage, seconds in timings.items():
+                self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+            for kind, count in tokens.items():
+                self.tokens[kind] += count
+            if chunks is not None:
+                self.chunks = (self.chunks or 0) + chunks
+
+    def server_timing(self):
+        with self.lock:
+            return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.timings.items())
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace():
+    """Make a new Trace the current one for this request's context"""
+    trace = Trace()
+    current_trace.set(trace)
+    return trace
+
+
+def active_trace():
+    """The current request's Trace, or a fresh one outside a request"""
+    return current_trace.get() or Trace()
+
+
+class TimedEmbeddings(Embeddings):
+    """Times query embedding as its own stage; the vector store calls it inside retrieval"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception as e:
+            errors.inc(stage="embed", error=type(e).__name__)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            trace = current_trace.get()
+            if trace is not None:
+                trace.record("embed", seconds)
+            else:
+                stage_seconds.observe(seconds, stage="embed")
+
+    def embed_query(self, text):
+        return self.timed(self.embeddings.embed_query, text)
+
+    def embed_documents(self, texts):
+        return self.timed(self.embeddings.embed_documents, texts)
@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import instrumentation
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+GROQ_MODEL = "llama3-70b-8192"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool"}
+
+upstream = instrumentation.Counter("rag_llm_upstream_total", "Upstream LLM HTTP attempts by outcome", ["outcome"])
+instrumentation.METRICS.append(upstream)
+
+
+class LLMError(Exception):
+    """Upstream LLM call failed; `retryable` says whether another attempt may succeed"""
+    retryable = False
+
+
+class LLMTimeoutError(LLMError):
+    retryable = True
+
+
+class LLMConnectionError(LLMError):
+    retryable = True
+
+
+class LLMCancelledError(LLMError):
+    """A hedged request stopped because the other one already answered"""
+
+
+class LLMStatusError(LLMError):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+        self.retryable = status in RETRY_STATUSES
+
+
+def backoff_delay(attempt, base, cap, retry_after=None):
+    """Full-jitter exponential backoff, or the server's Retry-After when it sent one.
+
+    Retry-After is not capped; a caller whose deadline cannot wait that long gives up instead.
+    """
+    if retry_after is not None:
+        return max(0.0, retry_after)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after_seconds(response):
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def outcome(error):
+    if isinstance(error, LLMStatusError):
+        return "429" if error.status == 429 else f"{error.status // 100}xx"
+    return "timeout" if isinstance(error, LLMTimeoutError) else "connection"
+
+
+# keep-alive pools shared by every model instance pointing at the same endpoint
+clients = {}
+async_clients = {}
+clients_lock = threading.Lock()
+hedge_pool = None
+
+
+def get_client(base_url, pool_size):
+    key = (base_url, pool_size)
+    with clients_lock:
+        if key not in clients:
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            clients[key] = httpx.Client(base_url=base_url, limits=limits)
+        return clients[key]
+
+
+def get_async_client(base_url, pool_size):
+    # an AsyncClient belongs to the loop it was created on
+    key = (base_url, pool_size, asyncio.get_running_loop())
+    with clients_lock:
+        if key not in async_clients:
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            async_clients[key] = httpx.AsyncClient(base_url=base_url, limits=limits)
+        return async_clients[key]
+
+
+def get_hedge_pool(size):
+    global hedge_pool
+    with clients_lock:
+        if hedge_pool is None:
+            hedge_pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="llm-hedge")
+        return hedge_pool
+
+
+class OpenAICompatibleChat(BaseChatModel):
+    """Chat model for any OpenAI-compatible /chat/completions endpoint.
+
+    Requests share a keep-alive connection pool and run against one deadline per call.
+    429 and 5xx responses and connection failures are retried with jittered exponential
+    backoff while the deadline allows. With `hedge_after` set, a second identical request
+    is started if the first has not answered by then, and the first answer wins.
+    """
+
+    base_url: str = GROQ_BASE_URL
+    api_key: str = ""
+    model: str = GROQ_MODEL
+    temperature: float = 0.7
+    timeout: float = 30.0
+    max_retries: int = 3
+    backoff_base: float = 0.25
+    backoff_max: float = 8.0
+    hedge_after: float = 0.0
+    pool_size: int = 20
+
+    @property
+    def _llm_type(self):
+        return "openai-compatible"
+
+    @property
+    def _identifying_params(self):
+        return {"base_url": self.base_url, "model": self.model}
+
+    def payload(self, messages, stop=None, stream=False):
+        body = {
+            "model": self.model,
+            "messages": [{"role": ROLES.get(m.type, m.type), "content": m.content} for m in messages],
+            "temperature": self.temperature,
+        }
+        if stop:
+            body["stop"] = stop
+        if stream:
+            body["stream"] = True
+        return body
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def check(self, response):
+        if response.status_code >= 400:
+            raise LLMStatusError(response.status_code, response.text[:200], retry_after_seconds(response))
+
+    def result(self, data):
+        choice = data["choices"][0]
+        usage = data.get("usage") or {}
+        message = AIMessage(content=choice["message"].get("content") or "")
+        if usage:
+            message.usage_metadata = {"input_tokens": usage.get("prompt_tokens", 0),
+                                      "output_tokens": usage.get("completion_tokens", 0),
+                                      "total_tokens": usage.get("total_tokens", 0)}
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": usage, "model_name": data.get("model", self.model)})
+
+    def attempt(self, body, timeout):
+        try:
+            response = get_client(self.base_url, self.pool_size).post(
+                "/chat/completions", json=body, headers=self.headers(), timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise LLMTimeoutError(f"LLM request timed out: {e}") from e
+        except httpx.TransportError as e:
+            raise LLMConnectionError(f"LLM connection failed: {e}") from e
+        self.check(response)
+        return response.json()
+
+    def post(self, body, deadline, cancelled=None):
+        """One logical request: attempts with backoff until success, a final error or the deadline.
+
+        Setting `cancelled` stops it before its next attempt or during a backoff sleep.
+        """
+        cancelled = cancelled or threading.Event()
+        attempt = 0
+        while True:
+            if cancelled.is_set():
+                raise LLMCancelledError("LLM request cancelled")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM request exceeded its {self.timeout}s deadline")
+            try:
+                data = self.attempt(body, remaining)
+                upstream.inc(outcome="ok")
+                return data
+            except LLMError as e:
+                upstream.inc(outcome=outcome(e))
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, getattr(e, "retry_after", None))
+                if not e.retryable or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+            cancelled.wait(delay)
+            attempt += 1
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        body = self.payload(messages, stop)
+        deadline = time.monotonic() + self.timeout
+        if self.hedge_after <= 0:
+            return self.result(self.post(body, deadline))
+
+        pool = get_hedge_pool(self.pool_size * 2)
+        cancelled = threading.Event()
+        first = pool.submit(self.post, body, deadline, cancelled)
+        try:
+            return self.result(first.result(timeout=self.hedge_after))
+        except FutureTimeout:
+            pass
+        upstream.inc(outcome="hedged")
+        pending = {first, pool.submit(self.post, body, deadline, cancelled)}
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return self.result(future.result())
+                    error = error or future.exception()
+            raise error
+        finally:
+            # an HTTP attempt already in flight runs to the end; the loser makes no further attempts
+            cancelled.set()
+
+    async def aattempt(self, body, timeout):
+        try:
+            response = await get_async_client(self.base_url, self.pool_size).post(
+                "/chat/completions", json=body, headers=self.headers(), timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise LLMTimeoutError(f"LLM request timed out: {e}") from e
+        except httpx.TransportError as e:
+            raise LLMConnectionError(f"LLM connection failed: {e}") from e
+        self.check(response)
+        return response.json()
+
+    async def apost(self, body, deadline):
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM request exceeded its {self.timeout}s deadline")
+            try:
+                data = await self.aattempt(body, remaining)
+                upstream.inc(outcome="ok")
+                return data
+            except LLMError as e:
+                upstream.inc(outcome=outcome(e))
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, getattr(e, "retry_after", None))
+                if not e.retryable or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        body = self.payload(messages, stop)
+        deadline = time.monotonic() + self.timeout
+        if self.hedge_after <= 0:
+            return self.result(await self.apost(body, deadline))
+
+        first = asyncio.ensure_future(self.apost(body, deadline))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return self.result(first.result())
+        upstream.inc(outcome="hedged")
+        pending = {first, asyncio.ensure_future(self.apost(body, deadline))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return self.result(task.result())
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        """Streamed tokens; failures before the first token are retried like _generate"""
+        body = self.payload(messages, stop, stream=True)
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM request exceeded its {self.timeout}s deadline")
+            started = False
+            try:
+                with get_client(self.base_url, self.pool_size).stream(
+                        "POST", "/chat/completions", json=body, headers=self.headers(), timeout=remaining) as response:
+                    if response.status_code >= 400:
+                        response.read()
+                    self.check(response)
+                    for line in response.iter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        choices = json.loads(data).get("choices") or [{}]
+                        token = (choices[0].get("delta") or {}).get("content")
+                        if token:
+                            started = True
+                            if run_manager:
+                                run_manager.on_llm_new_token(token)
+                            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+                upstream.inc(outcome="ok")
+                return
+            except httpx.TimeoutException as e:
+                error = LLMTimeoutError(f"LLM request timed out: {e}")
+            except httpx.TransportError as e:
+                error = LLMConnectionError(f"LLM connection failed: {e}")
+            except LLMError as e:
+                error = e
+            upstream.inc(outcome=outcome(error))
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, getattr(error, "retry_after", None))
+            if started or not error.retryable or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                raise error
+            time.sleep(delay)
+            attempt += 1
+
+
+def create_llm(backend=None):
+    """The chat model selected by LLM_BACKEND (groq, openai or stub) and the LLM_* settings"""
+    backend = (backend or os.getenv("LLM_BACKEND", "groq")).lower()
+    if backend == "stub":
+        from stub_llm import StubChatModel
+        return StubChatModel(latency=float(os.getenv("STUB_LLM_LATENCY", "0.2")),
+                             tokens_per_second=float(os.getenv("STUB_LLM_TOKENS_PER_SECOND", "200")))
+    if backend == "groq":
+        base_url, api_key, model = GROQ_BASE_URL, os.getenv("GROQ_API_KEY", ""), GROQ_MODEL
+    elif backend == "openai":
+        base_url, api_key, model = os.getenv("LLM_BASE_URL"), os.getenv("LLM_API_KEY", ""), os.getenv("LLM_MODEL")
+        if not base_url or not model:
+            raise ValueError("LLM_BACKEND=openai needs LLM_BASE_URL and LLM_MODEL")
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND {backend!r}; expected groq, openai or stub")
+    return OpenAICompatibleChat(
+        base_url=os.getenv("LLM_BASE_URL", base_url).rstrip("/"),
+        api_key=api_key,
+        model=os.getenv("LLM_MODEL", model),
+        temperature=float(os.getenv("LLM_TEMPERATURE", "0.7")),
+        timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+        backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "0.25")),
+        backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "8")),
+        hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "0")),
+        pool_size=int(os.getenv("LLM_POOL_SIZE", "20")),
+    )
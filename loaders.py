@@ -0,0 +1,114 @@
+import os
+import time
+import codecs
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+
+# Kept free of the embedding model so process-pool workers start cheaply.
+TEXT_EXTENSIONS = {".txt", ".md"}
+PDF_EXTENSIONS = {".pdf"}
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def discover_files(books_dir):
+    """Every supported file under books_dir, as sorted paths relative to it"""
+    found = []
+    for root, _, names in os.walk(books_dir):
+        for name in names:
+            ext = os.path.splitext(name)[1].lower()
+            if ext in TEXT_EXTENSIONS or ext in PDF_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(root, name), books_dir))
+    return sorted(found)
+
+
+def decode(data):
+    """Decode bytes read once from disk: BOM, then utf-8, then latin-1"""
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return data.decode(encoding), encoding
+    try:
+        return data.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        return data.decode("latin-1"), "latin-1"
+
+
+def load_file(path):
+    """Load one file, returning (docs, format, bytes, seconds)"""
+    start = time.perf_counter()
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        size = os.path.getsize(path)
+        if ext in PDF_EXTENSIONS:
+            from langchain_community.document_loaders import PyPDFLoader
+            docs = PyPDFLoader(path).load()
+            fmt = "pdf"
+        else:
+            with open(path, "rb") as f:
+                text, encoding = decode(f.read())
+            docs = [Document(page_content=text, metadata={"source": path, "encoding": encoding})]
+            fmt = "text"
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        return [], ext.lstrip(".") or "unknown", 0, time.perf_counter() - start
+    return docs, fmt, size, time.perf_counter() - start
+
+
+class LoadStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.formats = {}
+
+    def add(self, fmt, docs, size, seconds):
+        s = self.formats.setdefault(fmt, {"files": 0, "docs": 0, "bytes": 0, "seconds": 0.0})
+        s["files"] += 1
+        s["docs"] += docs
+        s["bytes"] += size
+        s["seconds"] += seconds
+
+    def report(self):
+        wall = max(time.perf_counter() - self.start, 1e-9)
+        for fmt, s in sorted(self.formats.items()):
+            mb = s["bytes"] / 1e6
+            print(f"  {fmt}: {s['files']} files, {s['docs']} docs, {mb:.1f} MB, "
+                  f"{s['files'] / wall:.1f} files/s, {mb / wall:.2f} MB/s wall "
+                  f"({s['seconds']:.2f}s worker time)")
+
+
+def iter_load(paths, workers=None, stats=None):
+    """Yield documents in file order, parsing up to `workers` files concurrently.
+
+    Only a small window of files is in flight at once, so memory stays bounded.
+    """
+    stats = stats or LoadStats()
+    if workers is None:
+        workers = min(len(paths), os.cpu_count() or 1)
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            docs, fmt, size, seconds = load_file(path)
+            stats.add(fmt, len(docs), size, seconds)
+            yield from docs
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            remaining = iter(paths)
+            for path in remaining:
+                pending.append(pool.submit(load_file, path))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                docs, fmt, size, seconds = pending.popleft().result()
+                for path in remaining:
+                    pending.append(pool.submit(load_file, path))
+                    break
+                stats.add(fmt, len(docs), size, seconds)
+                yield from docs
+    print("---load throughput---")
+    stats.report()
@@ -1,77 +1,463 @@
 import os
+import json
+import time
 import shutil
-from langchain_text_splitters import  RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
+import hashlib
+import argparse
+import uuid
+import threading
+import traceback
+from itertools import groupby
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.schema import Document
+from embedding_cache import CachedEmbeddings
+from embedding_engine import DEFAULT_BATCH_SIZE, LazyEmbeddings, ParallelEmbeddings
+from loaders import discover_files, iter_load
+from splitter import FastSplitter, iter_split
+from dedup import DEDUP_THRESHOLD, NearDuplicateFilter
+from sharding import SHARDS_DIR, group_files, load_shard_map, read_manifest, store_centroid, write_manifest
+from bm25_index import BM25_NAME, BM25Writer
+from vector_index import VECTORS_META, NumpyVectorStore, VectorIndexWriter
 
-embeddings= HuggingFaceEmbeddings(model_name= "sentence-transformers/all-MiniLM-L6-v2")
-def ingest(dir, files: list[str]) -> list:
-    docs = []
-    for i in files:
-        path = os.path.join(dir, "books", i)
-        try:
-            # Try with default encoding first
-            loader = TextLoader(path)
-            doc = loader.load()
-            docs.extend(doc)
-        except Exception as e:
-            try:
-                # Try with UTF-8 encoding
-                loader = TextLoader(path, encoding='utf-8')
-                doc = loader.load()
-                docs.extend(doc)
-            except Exception as e:
-                try:
-                    # Try with latin-1 encoding (should handle most characters)
-                    loader = TextLoader(path, encoding='latin-1')
-                    doc = loader.load()
-                    docs.extend(doc)
-                except Exception as e:
-                    print(f"Error loading {path}: {e}")
-                    continue
-    print(docs)
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "embedding_cache.sqlite")
+
+
+def hf_embeddings(batch_size=DEFAULT_BATCH_SIZE):
+    return HuggingFaceEmbeddings(model_name= MODEL_NAME, encode_kwargs={"batch_size": batch_size})
+
+
+embeddings= CachedEmbeddings(LazyEmbeddings(hf_embeddings), MODEL_NAME, EMBEDDING_CACHE)
+# cleared while ingest_in_background runs; rag.py waits on it before opening the index
+ingestion_done = threading.Event()
+ingestion_done.set()
+MANIFEST_NAME = "manifest.json"
+BATCH_SIZE = 256
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class Progress:
+    """Running counters and throughput for the ingest pipeline"""
+
+    def __init__(self, every=5.0):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.every = every
+        self.docs = 0
+        self.chunks = 0
+        self.embedded = 0
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        line = (f"{self.docs} docs ({self.docs / elapsed:.1f}/s), "
+                f"{self.chunks} chunks ({self.chunks / elapsed:.1f}/s), "
+                f"{self.embedded} embeddings ({self.embedded / elapsed:.1f}/s) in {elapsed:.1f}s")
+        if resource is not None:
+            line += f", peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB"
+        return line
+
+    def tick(self, force=False):
+        now = time.perf_counter()
+        if force or now - self.last >= self.every:
+            self.last = now
+            print(f"---progress: {self.summary()}---")
+
+
+def ingest(dir, files: list[str], workers=None) -> list:
+    docs = list(iter_ingest(dir, files, workers=workers))
+    print(f"Loaded {len(docs)} documents")
     return docs
 
 
-def splitting(doc):
-    print("---Creating chunks---")
-    text_splitter= RecursiveCharacterTextSplitter(
+def iter_ingest(dir, files, progress=None, workers=None):
+    """Yield documents in file order; files are parsed concurrently in a process pool"""
+    paths = [os.path.join(dir, "books", name) for name in files]
+    for doc in iter_load(paths, workers):
+        if progress:
+            progress.docs += 1
+        yield doc
+
+
+def text_splitter():
+    return FastSplitter(
         chunk_size= 1000,
         chunk_overlap= 200,
         separators= ["\n\n","\n"," ",""],
     )
-    chunks= text_splitter.split_documents(doc)
-    print("sample\n")
+
+
+def splitting(doc):
+    print("---Creating chunks---")
+    chunks= text_splitter().split_documents(doc)
+    print(f"Created {len(chunks)} chunks")
     return chunks
 
-def vectordb(persis_dir,chunks):
+
+def iter_splitting(docs, progress=None, workers=None):
+    """Yield chunks in document order; large documents are split in a process pool"""
+    for chunk in iter_split(docs, text_splitter(), workers):
+        if progress:
+            progress.chunks += 1
+        yield chunk
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def vectordb(persis_dir, chunks, batch_size=BATCH_SIZE, progress=None, backend="chroma", dtype="float32",
+             quantization=None, dedup=None):
     if(os.path.exists(persis_dir)):
         print("Removing existing db...")
         shutil.rmtree(persis_dir)
     
     print("Creating new db...")
-    db = Chroma.from_documents(documents=chunks,
-                              embedding=embeddings,
-                              persist_directory=persis_dir)
+    if backend == "numpy":
+        writer = VectorIndexWriter(persis_dir, dtype, quantization)
+    else:
+        db = Chroma(embedding_function=embeddings, persist_directory=persis_dir)
+    bm25 = BM25Writer(os.path.join(persis_dir, BM25_NAME))
+    written = []
+    if dedup is not None:
+        chunks = dedup.filter(chunks)
+    # chunks may be a generator; embed and upsert fixed-size batches as they arrive
+    for batch in batched(chunks, batch_size):
+        ids = [uuid.uuid4().hex for _ in batch]
+        if dedup is not None:
+            written.extend(ids)
+        if backend == "numpy":
+            writer.add(batch, ids, embeddings.embed_documents([c.page_content for c in batch]))
+        else:
+            db.add_documents(batch, ids=ids)
+        bm25.add(batch, ids)
+        if progress:
+            progress.embedded += len(batch)
+            progress.tick()
+    if dedup is not None:
+        # a kept chunk may absorb duplicates after it was written, so provenance is merged in last
+        merged = dedup.provenance()
+        bm25.update_metadata(merged)
+        if backend == "numpy":
+            writer.update_metadata(merged)
+        else:
+            for batch in batched(sorted(merged), batch_size):
+                db._collection.update(ids=[written[i] for i in batch], metadatas=[merged[i] for i in batch])
+        print(f"---dedup: {dedup.summary()}---")
+    bm25.close()
+    if backend == "numpy":
+        writer.close()
+        db = NumpyVectorStore(persis_dir, embeddings)
     print("---created db---")
+    if progress:
+        progress.tick(force=True)
+    print(f"Embedding cache: {embeddings.hits} hits, {embeddings.misses} model calls")
     return db
-       
 
-def main():
+
+def store_size(db):
+    return db.count if isinstance(db, NumpyVectorStore) else db._collection.count()
+
+
+def sharded_vectordb(persis_dir, dir, files, timestamp, shard_map, only=None, base=None, batch_size=BATCH_SIZE,
+                     progress=None, workers=None, backend="chroma", dtype="float32", quantization=None,
+                     dedup_threshold=0):
+    """Build one store per topic under db/shards and write a shards.json in persis_dir listing them.
+
+    With only, just those shards are rebuilt; the others are reused from the sharded snapshot base.
+    """
+    shards = {}
+    if only:
+        previous = read_manifest(base) if base else None
+        if previous is None:
+            raise ValueError(f"{base} is not a sharded snapshot; build all shards first with --shards")
+        shards = previous["shards"]
+    groups = group_files(files, shard_map)
+    for name, names in groups.items():
+        if only and name not in only:
+            continue
+        shard_dir = os.path.join(os.path.dirname(persis_dir), SHARDS_DIR, f"{name}_{timestamp}")
+        print(f"---building shard {name} from {len(names)} files---")
+        docs = iter_ingest(dir, names, progress, workers)
+        chunks = iter_splitting(docs, progress, workers)
+        dedup = NearDuplicateFilter(dedup_threshold) if dedup_threshold else None
+        db = vectordb(shard_dir, chunks, batch_size, progress, backend, dtype, quantization, dedup)
+        shards[name] = {"path": shard_dir, "files": names, "chunks": store_size(db),
+                        "keywords": shard_map.get(name, {}).get("keywords", []), "centroid": store_centroid(db)}
+    for name in only or []:
+        if name not in groups and shards.pop(name, None):
+            print(f"Removed shard {name}: no files map to it anymore")
+    for entry in shards.values():
+        entry["dir"] = os.path.relpath(entry["path"], persis_dir)
+    write_manifest(persis_dir, shards)
+    print("---shards: " + ", ".join(f"{name} {entry['chunks']} chunks" for name, entry in shards.items()) + "---")
+    return shards
+
+
+def file_hash(path):
+    """Return the sha256 hex digest of a file's bytes"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_ids(name, chunks):
+    """Content-addressed ids for the chunks of one file, stable across runs.
+
+    The page and start_index are part of the id, so a chunk that moved gets re-added with
+    its new offset; its embedding still comes from the cache.
+    """
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        position = f"{chunk.metadata.get('page', '')}:{chunk.metadata.get('start_index', '')}"
+        digest = hashlib.sha256(f"{name}\0{position}\0{chunk.page_content}".encode("utf-8")).hexdigest()[:32]
+        # identical chunk text inside one file still needs distinct ids
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        ids.append(digest if n == 0 else f"{digest}-{n}")
+    return ids
+
+
+def load_manifest(persis_dir):
+    path = os.path.join(persis_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"files": {}}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading manifest {path}: {e}. Rebuilding it.")
+        return {"files": {}}
+
+
+def save_manifest(persis_dir, manifest):
+    path = os.path.join(persis_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def rebuild_bm25(db, persis_dir, batch_size=BATCH_SIZE):
+    """Re-tokenize the stored chunks into a fresh BM25 index; no embedding involved"""
+    bm25 = BM25Writer(os.path.join(persis_dir, BM25_NAME))
+    offset = 0
+    while True:
+        page = db.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        docs = [Document(page_content=text, metadata=meta or {})
+                for text, meta in zip(page["documents"], page["metadatas"])]
+        bm25.add(docs, page["ids"])
+        offset += len(page["ids"])
+    bm25.close()
+
+
+def export_numpy(db, persis_dir, dtype="float32", batch_size=BATCH_SIZE, quantization=None):
+    """Write the collection's stored vectors as a memory-mappable matrix; no embedding involved"""
+    writer = VectorIndexWriter(persis_dir, dtype, quantization)
+    offset = 0
+    while True:
+        page = db.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        docs = [Document(page_content=text, metadata=meta or {})
+                for text, meta in zip(page["documents"], page["metadatas"])]
+        writer.add(docs, page["ids"], page["embeddings"])
+        offset += len(page["ids"])
+    writer.close()
+
+
+def incremental_vectordb(persis_dir, dir, files, batch_size=BATCH_SIZE, progress=None, workers=None,
+                         backend="chroma", dtype="float32", quantization=None, dedup_threshold=0):
+    """Update the collection in place, re-embedding only new or changed chunks"""
+    os.makedirs(persis_dir, exist_ok=True)
+    manifest = load_manifest(persis_dir)
+    known = manifest["files"]
+    db = Chroma(embedding_function=embeddings, persist_directory=persis_dir)
+    if known and not db.get(limit=1)["ids"]:
+        print("Manifest found but collection is empty. Rebuilding manifest...")
+        known = {}
+
+    added = removed = skipped = dropped = 0
+    changed = {}
+    for name in files:
+        path = os.path.join(dir, "books", name)
+        if not os.path.exists(path):
+            continue
+        digest = file_hash(path)
+        entry = known.get(name)
+        if entry and entry["hash"] == digest:
+            skipped += 1
+            continue
+        changed[name] = digest
+
+    names = {os.path.join(dir, "books", name): name for name in changed}
+    docs = iter_ingest(dir, list(changed), progress, workers)
+    # loaders yield each file's documents contiguously, in file order
+    for source, file_docs in groupby(docs, key=lambda d: d.metadata["source"]):
+        name = names[source]
+        digest = changed[name]
+        entry = known.get(name)
+        chunks = list(iter_splitting(file_docs, progress, workers=1))
+        if dedup_threshold:
+            # within one file only: a chunk must not depend on another file that may change on its own
+            dedup = NearDuplicateFilter(dedup_threshold)
+            chunks = dedup.collapse(chunks)
+            dropped += dedup.dropped
+        ids = chunk_ids(name, chunks)
+        old_ids = set(entry["chunks"]) if entry else set()
+        new_ids = set(ids)
+        stale = [i for i in old_ids if i not in new_ids]
+        fresh = [(i, c) for i, c in zip(ids, chunks) if i not in old_ids]
+        if stale:
+            db.delete(ids=stale)
+        for batch in batched(fresh, batch_size):
+            db.add_documents([c for _, c in batch], ids=[i for i, _ in batch])
+            if progress:
+                progress.embedded += len(batch)
+                progress.tick()
+        added += len(fresh)
+        removed += len(stale)
+        known[name] = {"hash": digest, "chunks": ids}
+
+    for name in [n for n in known if n not in files or not os.path.exists(os.path.join(dir, "books", n))]:
+        stale = known.pop(name)["chunks"]
+        if stale:
+            db.delete(ids=stale)
+        removed += len(stale)
+        print(f"Removed {name} from db")
+
+    manifest["files"] = known
+    save_manifest(persis_dir, manifest)
+    if added or removed or not os.path.exists(os.path.join(persis_dir, BM25_NAME)):
+        rebuild_bm25(db, persis_dir, batch_size)
+    # Chroma stays the updatable source of truth; the numpy matrix is re-exported from it
+    if backend == "numpy":
+        export_numpy(db, persis_dir, dtype, batch_size, quantization)
+    elif os.path.exists(os.path.join(persis_dir, VECTORS_META)):
+        os.remove(os.path.join(persis_dir, VECTORS_META))
+    print(f"---updated db: {added} chunks added, {removed} removed, {skipped} files unchanged---")
+    if dedup_threshold:
+        print(f"---dedup: {dropped} near-duplicate chunks dropped from changed files---")
+    if progress:
+        progress.tick(force=True)
+    print(f"Embedding cache: {embeddings.hits} hits, {embeddings.misses} model calls")
+    return db
+
+
+def use_embedding_engine(engine, workers=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Swap the model behind the shared cached embeddings ("default" or "parallel")"""
+    if engine == "parallel":
+        embeddings.embeddings = ParallelEmbeddings(MODEL_NAME, workers, batch_size)
+    else:
+        embeddings.embeddings = LazyEmbeddings(lambda: hf_embeddings(batch_size))
+    return embeddings.embeddings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the blockchain knowledge vector db")
+    parser.add_argument("--incremental", action="store_true",
+                        help="update db/chroma in place, re-embedding only new or changed chunks")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="number of chunks embedded and written per batch")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes used to load, parse and split files (default: one per CPU)")
+    parser.add_argument("--engine", choices=["default", "parallel"], default="default",
+                        help="embedding engine: in-process model or a pool of model worker processes")
+    parser.add_argument("--embed-workers", type=int, default=None,
+                        help="embedding worker processes for --engine parallel (default: half the CPUs)")
+    parser.add_argument("--embed-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="texts per model forward pass")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma",
+                        help="vector store written for rag.py: Chroma or a memory-mapped numpy matrix")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                        help="element type of the numpy backend's matrix")
+    parser.add_argument("--quantization", choices=["int8", "binary"], default=None,
+                        help="also store int8 or binary codes for a fast first pass with exact rescoring")
+    parser.add_argument("--shards", action="store_true",
+                        help="build one store per topic (see --shard-map) that rag.py routes queries to")
+    parser.add_argument("--shard", action="append", default=None, metavar="NAME",
+                        help="rebuild only this shard of the current sharded snapshot (repeatable)")
+    parser.add_argument("--shard-map", default=None,
+                        help="JSON file mapping shard names to file patterns and query keywords (default: SHARD_MAP)")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="drop chunks at least this Jaccard-similar to an earlier chunk, e.g. 0.8 "
+                             "(default: DEDUP_THRESHOLD or 0, off)")
+    args = parser.parse_args(argv)
+    if args.quantization and args.backend != "numpy":
+        parser.error("--quantization requires --backend numpy")
+    if args.incremental and (args.shards or args.shard):
+        parser.error("--incremental does not update shards; rebuild the changed ones with --shard NAME")
+    engine = use_embedding_engine(args.engine, args.embed_workers, args.embed_batch_size)
+
     curr_dir= os.path.dirname(os.path.abspath(__file__))
-    import time
-    timestamp = str(int(time.time()))
-    perist_dir= os.path.join(curr_dir,"db", f"chroma_{timestamp}")
-    files= ["bitcoin.txt", "sol.txt", "eth.txt"]
+    files= discover_files(os.path.join(curr_dir, "books"))
     print (files)
-    loaded_files= ingest(curr_dir, files)
-    chunks= splitting(loaded_files)
-    db= vectordb(perist_dir, chunks)
-    
+    progress = Progress()
+    if args.incremental:
+        perist_dir= os.path.join(curr_dir, "db", "chroma")
+        db= incremental_vectordb(perist_dir, curr_dir, files, args.batch_size, progress, args.workers,
+                                 args.backend, args.dtype, args.quantization, args.dedup_threshold)
+    elif args.shards or args.shard:
+        timestamp = str(int(time.time()))
+        perist_dir= os.path.join(curr_dir,"db", f"chroma_{timestamp}")
+        base = None
+        if os.path.exists(os.path.join(curr_dir, "db", "latest_db.txt")):
+            with open(os.path.join(curr_dir, "db", "latest_db.txt"), "r") as f:
+                base = f.read().strip()
+        sharded_vectordb(perist_dir, curr_dir, files, timestamp, load_shard_map(args.shard_map), args.shard, base,
+                         args.batch_size, progress, args.workers, args.backend, args.dtype, args.quantization,
+                         args.dedup_threshold)
+    else:
+        timestamp = str(int(time.time()))
+        perist_dir= os.path.join(curr_dir,"db", f"chroma_{timestamp}")
+        loaded_files= iter_ingest(curr_dir, files, progress, args.workers)
+        chunks= iter_splitting(loaded_files, progress, args.workers)
+        dedup = NearDuplicateFilter(args.dedup_threshold) if args.dedup_threshold else None
+        db= vectordb(perist_dir, chunks, args.batch_size, progress, args.backend, args.dtype, args.quantization,
+                     dedup)
+    if isinstance(engine, ParallelEmbeddings):
+        print(f"Embedding engine: {engine.texts} texts on {engine.workers} workers, {engine.throughput():.1f} texts/s")
+        engine.close()
+
     # Write the latest db path to a file
     with open(os.path.join(curr_dir, "db", "latest_db.txt"), "w") as f:
         f.write(perist_dir)
 
-main()
\ No newline at end of file
+def ingest_in_background(argv=()):
+    """Run main(argv) on a thread of this process, so a server starting alongside shares its model"""
+    ingestion_done.clear()
+
+    def run():
+        started = time.perf_counter()
+        try:
+            main(list(argv))
+            print(f"Background ingestion finished in {time.perf_counter() - started:.1f}s")
+        except (Exception, SystemExit) as e:
+            # argparse errors exit; the server must still stop waiting
+            print(f"Background ingestion failed: {e}")
+            traceback.print_exc()
+        finally:
+            ingestion_done.set()
+
+    thread = threading.Thread(target=run, name="ingest", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,146 @@
-from langchain_groq import ChatGroq
-from langchain_core.runnables import RunnablePassthrough
+import time
+startup_start = time.perf_counter()
+
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.retrievers import BM25Retriever
 from dotenv import load_dotenv
 from langchain_chroma import Chroma
-from my_langchain import embeddings
+from my_langchain import embeddings, ingestion_done
+from answer_cache import AnswerCache, normalize
+from async_runner import AsyncRunner, SingleFlight
+from bm25_index import BM25_NAME, BM25Index, HybridRetriever, KeywordRetriever
+from vector_index import VECTORS_META, NumpyVectorStore
+from context_packing import DEFAULT_CONTEXT_BUDGET, ContextPacker, approx_tokens
+from relevance import RelevanceGate, ScoredRetriever, cosine_relevance
+from sharding import SHARDS_DIR, ShardedRetriever, ShardRouter, read_manifest
+import instrumentation
+from admission import AdmissionController, Overloaded
+from llm_backend import LLMConnectionError, LLMStatusError, LLMTimeoutError, create_llm
 
 import os
 import sys
+import shutil
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from operator import itemgetter
 from langchain.prompts import ChatPromptTemplate
+startup_timings = {"imports": time.perf_counter() - startup_start}
 # Load environment variables
 load_dotenv()
 
+# LLM_BACKEND: groq (default), openai (any OpenAI-compatible server at LLM_BASE_URL),
+# or stub, a deterministic offline model for benchmarks and local development
+llm_backend = os.getenv("LLM_BACKEND", "groq").lower()
+
 # Check if GROQ API key is set
-if not os.getenv("GROQ_API_KEY"):
+if llm_backend == "groq" and not os.getenv("GROQ_API_KEY"):
     print("ERROR: GROQ_API_KEY not found in environment variables. Please check your .env file.")
     sys.exit(1)
 
 # Initialize LLM with proper error handling
 try:
-    llm = ChatGroq(model="llama3-70b-8192")
+    stage_start = time.perf_counter()
+    llm = create_llm(llm_backend)
     curr_dir = os.path.dirname(os.path.abspath(__file__))
+    startup_timings["llm_client"] = time.perf_counter() - stage_start
 except Exception as e:
-    print(f"ERROR initializing ChatGroq: {e}")
+    print(f"ERROR initializing the LLM client: {e}")
     sys.exit(1)
 
-def retreiver(db):
+answer_cache = AnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+    max_bytes=int(os.getenv("ANSWER_CACHE_MAX_MB", "32")) * 1024 * 1024,
+)
+answer_cache_enabled = os.getenv("ANSWER_CACHE_ENABLED", "1") != "0"
+
+def db_version():
+    """Identifies the index latest_db.txt points at; changes whenever an ingest rewrites it"""
+    latest_db_file = os.path.join(curr_dir, "db", "latest_db.txt")
     try:
-        retriever = db.as_retriever(search_type="similarity", search_kwargs={"k": 4})
+        with open(latest_db_file, "r") as f:
+            return f"{f.read().strip()}:{os.stat(latest_db_file).st_mtime_ns}"
+    except OSError:
+        return None
+
+def cache_stats():
+    return answer_cache.snapshot()
+
+max_concurrent_llm = int(os.getenv("MAX_CONCURRENT_LLM", "8"))
+runner = None
+runner_lock = threading.Lock()
+# identical questions in flight on the synchronous path share one chain run
+flights = SingleFlight()
+
+def get_runner():
+    global runner
+    if runner is None:
+        with runner_lock:
+            if runner is None:
+                runner = AsyncRunner(max_concurrent_llm)
+    return runner
+
+def open_store(persist_dir):
+    """The numpy matrix when the snapshot has one, otherwise the Chroma collection"""
+    if os.path.exists(os.path.join(persist_dir, VECTORS_META)):
+        oversample = os.getenv("QUANTIZED_OVERSAMPLE")
+        return NumpyVectorStore(persist_dir, instrumentation.TimedEmbeddings(embeddings),
+                                oversample=int(oversample) if oversample else None)
+    return Chroma(embedding_function=instrumentation.TimedEmbeddings(embeddings), persist_directory=persist_dir,
+                  relevance_score_fn=cosine_relevance)
+
+context_packer = ContextPacker(budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", str(DEFAULT_CONTEXT_BUDGET))))
+
+def context_stats():
+    return context_packer.snapshot()
+
+# RELEVANCE_THRESHOLD: below this best relevance score (0-1) the LLM is skipped (0 disables);
+# RELEVANCE_MARGIN: chunks scoring more than this below the best one are left out of the context;
+# RELEVANCE_KEYWORD_THRESHOLD: a BM25 hit with at least this keyword score (0-1) always keeps the LLM call
+relevance_gate = RelevanceGate(threshold=float(os.getenv("RELEVANCE_THRESHOLD", "0")),
+                               margin=float(os.getenv("RELEVANCE_MARGIN", "0")),
+                               context_budget=context_packer.budget,
+                               keyword_threshold=float(os.getenv("RELEVANCE_KEYWORD_THRESHOLD", "0.5")))
+
+def relevance_stats():
+    return relevance_gate.snapshot()
+
+retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+def retreiver(db, persist_dir=None):
+    try:
+        bm25_path = os.path.join(persist_dir, BM25_NAME) if persist_dir else None
+        if retrieval_mode in ("hybrid", "bm25") and bm25_path and os.path.exists(bm25_path):
+            # opened lazily on the first query, so startup cost does not grow with the corpus
+            index = BM25Index(bm25_path)
+            if retrieval_mode == "bm25":
+                return KeywordRetriever(index=index, k=4)
+            dense = ScoredRetriever(vectorstore=db, k=10)
+            return HybridRetriever(vector_retriever=dense, index=index, k=4, fetch_k=10)
+        retriever = ScoredRetriever(vectorstore=db, k=4)
         return retriever
     except Exception as e:
         print(f"Error creating retriever: {e}")
         raise
 
-def create_chain(persist_dir):
-    try:
-        # Check if the persist_dir exists
-        if not os.path.exists(persist_dir):
-            print(f"Error: Database directory not found at {persist_dir}")
-            # Try to find the latest database
-            db_dir = os.path.join(curr_dir, "db")
-            if os.path.exists(db_dir):
-                subfolders = [f for f in os.listdir(db_dir) if os.path.isdir(os.path.join(db_dir, f)) and f.startswith("chroma")]
-                if subfolders:
-                    # Use the most recent chroma folder (assuming naming convention with timestamps)
-                    latest_db = os.path.join(db_dir, sorted(subfolders)[-1])
-                    print(f"Using alternative database at {latest_db}")
-                    persist_dir = latest_db
-                else:
-                    raise FileNotFoundError(f"No chroma database folders found in {db_dir}")
-            else:
-                raise FileNotFoundError(f"Database directory {db_dir} not found")
-        
-        db = Chroma(embedding_function=embeddings, persist_directory=persist_dir)
-        retrieved = retreiver(db)
-        
-        template = """
+# SHARD_ROUTING: auto (keyword rules, else nearest centroids), keywords, centroid or all
+shard_routing = os.getenv("SHARD_ROUTING", "auto")
+shard_max_routed = int(os.getenv("SHARD_MAX_ROUTED", "2"))
+shard_route_margin = float(os.getenv("SHARD_ROUTE_MARGIN", "0.05"))
+
+def sharded_retriever(manifest):
+    """One retriever per shard of a sharded snapshot, behind a router that picks which ones to search"""
+    shards = manifest["shards"]
+    retrievers = {name: retreiver(open_store(entry["path"]), entry["path"]) for name, entry in shards.items()}
+    router = ShardRouter(shards, shard_routing, shard_max_routed, shard_route_margin)
+    pool = ThreadPoolExecutor(max_workers=max(4, 2 * len(shards)), thread_name_prefix="shard")
+    return ShardedRetriever(retrievers=retrievers, router=router, embeddings=instrumentation.TimedEmbeddings(embeddings),
+                            k=4, pool=pool)
+
+PROMPT_TEMPLATE = """
         You are an expert blockchain and cryptocurrency analyst with deep knowledge of Bitcoin, Ethereum, and Solana. 
         You excel at both technical analysis and engaging conversation. Your responses should be natural, insightful, and demonstrate deep understanding.
 
@@ -88,24 +173,68 @@ def create_chain(persist_dir):
         
         Answer:"""
 
-        prompt = ChatPromptTemplate.from_template(template)
+def create_chain(persist_dir):
+    try:
+        # Check if the persist_dir exists
+        if not os.path.exists(persist_dir):
+            print(f"Error: Database directory not found at {persist_dir}")
+            # Try to find the latest database
+            db_dir = os.path.join(curr_dir, "db")
+            if os.path.exists(db_dir):
+                subfolders = [f for f in os.listdir(db_dir) if os.path.isdir(os.path.join(db_dir, f)) and f.startswith("chroma")]
+                if subfolders:
+                    # Use the most recent chroma folder (assuming naming convention with timestamps)
+                    latest_db = os.path.join(db_dir, sorted(subfolders)[-1])
+                    print(f"Using alternative database at {latest_db}")
+                    persist_dir = latest_db
+                else:
+                    raise FileNotFoundError(f"No chroma database folders found in {db_dir}")
+            else:
+                raise FileNotFoundError(f"Database directory {db_dir} not found")
+        
+        manifest = read_manifest(persist_dir)
+        if manifest:
+            retrieved = sharded_retriever(manifest)
+        else:
+            db = open_store(persist_dir)
+            retrieved = retreiver(db, persist_dir)
+        
+        prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
 
-        chain = (
+        answer = (
         {
-            "context": retrieved,
-            "question": RunnablePassthrough()
+            "context": itemgetter("docs") | RunnableLambda(context_packer.pack),
+            "question": itemgetter("question")
         }
         | prompt
         | llm
         | StrOutputParser())
 
+        # retrieval stays the first step, so warm_chain() still runs it without the LLM
+        chain = (
+        {
+            "docs": retrieved | RunnableLambda(relevance_gate.trim),
+            "question": RunnablePassthrough()
+        }
+        | RunnableBranch(
+            (relevance_gate.irrelevant,
+             RunnableLambda(partial(relevance_gate.decline, prompt_tokens=approx_tokens(PROMPT_TEMPLATE)))),
+            answer))
+
         return chain
     except Exception as e:
         print(f"Error creating chain: {e}")
         raise
 
 # Initialize the chain with proper error handling
+current_db = (None, None)
 try:
+    if not ingestion_done.is_set():
+        # run.py --fast builds the first snapshot in this process while the server starts
+        print("Waiting for background ingestion to finish...")
+        stage_start = time.perf_counter()
+        ingestion_done.wait()
+        startup_timings["wait_for_ingestion"] = time.perf_counter() - stage_start
     # Try to read the latest db path first
     db_path = None
     latest_db_file = os.path.join(curr_dir, "db", "latest_db.txt")
@@ -118,30 +247,393 @@ try:
         db_path = os.path.join(curr_dir, "db", "chroma")
     
     print(f"Initializing with database: {db_path}")
+    stage_start = time.perf_counter()
+    current_db = (db_path, db_version())
     chain = create_chain(db_path)
+    startup_timings["open_index_and_chain"] = time.perf_counter() - stage_start
 except Exception as e:
     print(f"Error initializing chain: {e}")
     chain = None
 
+WARMUP_QUERY = "What is blockchain consensus?"
+
+def warm_chain(c, query=WARMUP_QUERY):
+    # the chain's first step is retrieval; invoking it alone skips the LLM
+    c.first.invoke(query)
+
+def warmup(query=WARMUP_QUERY):
+    """Page in the model weights and index with one query embedding and one retrieval"""
+    stage_start = time.perf_counter()
+    # bypass the embedding cache so the model is really loaded
+    embeddings.embeddings.embed_query(query)
+    startup_timings["warmup_embedding"] = time.perf_counter() - stage_start
+    if chain is not None:
+        stage_start = time.perf_counter()
+        warm_chain(chain, query)
+        startup_timings["warmup_retrieval"] = time.perf_counter() - stage_start
+    return startup_timings
+
+index_watch_interval = float(os.getenv("INDEX_WATCH_INTERVAL", "5"))
+snapshot_retention = int(os.getenv("SNAPSHOT_RETENTION", "2"))
+reload_lock = threading.Lock()
+watcher = None
+
+def active_chain():
+    """The chain for a new request and the index version its answers are cached under.
+
+    reload_chain() assigns chain before current_db, so reading the version first never
+    pairs an old chain with the new version.
+    """
+    version = current_db[1]
+    return chain, version
+
+def latest_db_path():
+    try:
+        with open(os.path.join(curr_dir, "db", "latest_db.txt"), "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def reload_chain(force=False):
+    """Open and warm the index latest_db.txt points at, then swap it in for new requests.
+
+    In-flight requests keep the chain they started with. Returns True if a swap happened.
+    """
+    global chain, current_db
+    with reload_lock:
+        path, version = latest_db_path(), db_version()
+        if not path or not os.path.exists(path):
+            return False
+        if not force and (path, version) == current_db:
+            return False
+        stage_start = time.perf_counter()
+        if path == current_db[0]:
+            # an incremental ingest rewrote this path; Chroma's cached client would serve the old data
+            reset_chroma_clients()
+        new_chain = create_chain(path)
+        warm_chain(new_chain)
+        # chain before current_db; see active_chain()
+        chain = new_chain
+        current_db = (path, version)
+        print(f"Reloaded index {path} in {(time.perf_counter() - stage_start) * 1000:.0f} ms")
+    prune_snapshots(path)
+    return True
+
+def prune_snapshots(active):
+    """Delete chroma_* snapshots beyond the newest SNAPSHOT_RETENTION, never the active one"""
+    db_dir = os.path.join(curr_dir, "db")
+    if snapshot_retention <= 0 or not os.path.isdir(db_dir):
+        return
+    # the previous snapshot stays within the retention window, so requests still using it are safe
+    snapshots = sorted(f for f in os.listdir(db_dir)
+                       if f.startswith("chroma_") and os.path.isdir(os.path.join(db_dir, f)))
+    keep = set(snapshots[-snapshot_retention:]) | {os.path.basename(os.path.normpath(active))}
+    for name in snapshots:
+        if name not in keep:
+            try:
+                shutil.rmtree(os.path.join(db_dir, name))
+                print(f"Removed superseded snapshot {name}")
+            except OSError as e:
+                print(f"Error removing snapshot {name}: {e}")
+    prune_shards(db_dir, [os.path.join(db_dir, name) for name in snapshots if name in keep])
+
+def prune_shards(db_dir, kept):
+    """Delete shard stores no kept snapshot uses and that are older than all of them.
+
+    Newer unreferenced shards may belong to a build still in progress.
+    """
+    shards_dir = os.path.join(db_dir, SHARDS_DIR)
+    if not os.path.isdir(shards_dir):
+        return
+    used = set()
+    for snapshot in kept:
+        manifest = read_manifest(snapshot)
+        if manifest:
+            used.update(os.path.basename(entry["path"]) for entry in manifest["shards"].values())
+    stamps = [int(os.path.basename(s).rsplit("_", 1)[1]) for s in kept if os.path.basename(s).rsplit("_", 1)[1].isdigit()]
+    if not stamps:
+        return
+    for name in os.listdir(shards_dir):
+        stamp = name.rsplit("_", 1)[-1]
+        if name not in used and stamp.isdigit() and int(stamp) < min(stamps):
+            try:
+                shutil.rmtree(os.path.join(shards_dir, name))
+                print(f"Removed unused shard {name}")
+            except OSError as e:
+                print(f"Error removing shard {name}: {e}")
+
+def watch_index(interval=None):
+    """Poll latest_db.txt in a daemon thread and hot-reload the chain when it changes"""
+    global watcher
+    interval = index_watch_interval if interval is None else interval
+    if interval <= 0 or watcher is not None:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                reload_chain()
+            except Exception as e:
+                print(f"Error reloading index: {e}")
+
+    watcher = threading.Thread(target=loop, name="index-watcher", daemon=True)
+    watcher.start()
+
+def reset_chroma_clients():
+    """Drop Chroma's per-path client cache so the next open reads the files again.
+
+    Stores already open keep their own clients, so in-flight requests are unaffected.
+    """
+    try:
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+    except (ImportError, AttributeError):
+        pass
+
+def after_fork(watch_interval=None, workers=1):
+    """Reset per-process state in a worker forked from a preloaded master.
+
+    Model weights and memory-mapped vectors stay shared; database connections, locks
+    and threads do not survive fork and are recreated. Each of the `workers` processes
+    gets an equal share of the LLM rate budget.
+    """
+    global chain, runner, runner_lock, reload_lock, watcher, admission, flights
+    runner = None
+    runner_lock = threading.Lock()
+    flights = SingleFlight()
+    reload_lock = threading.Lock()
+    watcher = None
+    # Chroma caches one client per path, holding the master's sqlite connection
+    reset_chroma_clients()
+    if current_db[0]:
+        chain = create_chain(current_db[0])
+    watch_index(watch_interval)
+    # the buckets are per process, so N workers at the full limit would send N times it
+    admission = create_admission(max(1, workers))
+
+# LLM_RPM / LLM_TPM: the provider's requests- and tokens-per-minute limits (0 = unlimited),
+# split evenly between the serving processes
+def create_admission(processes=1):
+    return AdmissionController(rpm=int(os.getenv("LLM_RPM", "0")) / processes,
+                               tpm=int(os.getenv("LLM_TPM", "0")) / processes,
+                               max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+                               max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "10")))
+
+admission = create_admission()
+completion_token_estimate = int(os.getenv("ADMISSION_COMPLETION_TOKENS", "300"))
+
+def estimate_tokens(query):
+    """Upper estimate of one call's prompt and completion tokens, charged at admission"""
+    return (approx_tokens(PROMPT_TEMPLATE) + context_packer.budget + approx_tokens(query)
+            + completion_token_estimate)
+
+def admit(query, deadline=None):
+    """Wait for rate budget before a query may reach the LLM; None when it will not need the LLM.
+
+    Raises admission.Overloaded when the request is shed or its deadline passes in line.
+    """
+    current, version = active_chain()
+    if not admission.enabled or current is None or not query or len(query.strip()) < 2:
+        return None
+    if answer_cache_enabled and answer_cache.get(query, version, embeddings.embed_query, count=False) is not None:
+        return None
+    return admission.admit(estimate_tokens(query), deadline)
+
+def admission_stats():
+    return admission.snapshot()
+
 def generate(query):
+    # one chain for the whole request, even if a reload swaps the global meanwhile
+    current, version = active_chain()
+    trace = instrumentation.active_trace()
+    started = time.perf_counter()
     try:
-        if chain is None:
+        if current is None:
             return "Error: The RAG system is not properly initialized. Please check your database and API key."
         
         # Improved error handling and user feedback
         if not query or len(query.strip()) < 2:
             return "Please provide a valid question about blockchain technologies."
-            
-        response = chain.invoke(query)
+
+        if answer_cache_enabled:
+            cached = answer_cache.get(query, version, embeddings.embed_query)
+            if cached is not None:
+                return cached
+
+        response = flights.do(normalize(query), lambda: current.invoke(query, config={"callbacks": [trace]}))
+        if answer_cache_enabled and response:
+            answer_cache.put(query, response, version, embeddings.embed_query)
+        return response
+    except Exception as e:
+        instrumentation.errors.inc(stage="total", error=type(e).__name__)
+        return error_message(e)
+    finally:
+        trace.record("total", time.perf_counter() - started)
+
+def error_message(e):
+    if isinstance(e, Overloaded):
+        return f"Error: {e}"
+    if isinstance(e, LLMStatusError) and e.status in (401, 403):
+        return "Error: There seems to be an issue with the API key. Please check your GROQ_API_KEY in the .env file."
+    if isinstance(e, LLMStatusError) and e.status == 429:
+        return "Error: The language model is rate limiting requests right now. Please try again shortly."
+    if isinstance(e, (LLMTimeoutError, LLMConnectionError)):
+        return "Error: Could not connect to the GROQ API. Please check your internet connection."
+    error_msg = str(e)
+    if "api_key" in error_msg.lower() or "apikey" in error_msg.lower():
+        return "Error: There seems to be an issue with the API key. Please check your GROQ_API_KEY in the .env file."
+    elif "timeout" in error_msg.lower() or "connection" in error_msg.lower():
+        return "Error: Could not connect to the GROQ API. Please check your internet connection."
+    else:
+        return f"Error generating response: {error_msg}"
+
+async def agenerate(query, trace=None):
+    """Async generate(): bounded concurrency, and identical in-flight queries share one LLM call"""
+    current, version = active_chain()
+    trace = trace or instrumentation.Trace()
+    # the embedding stage finds the trace through the context of this task
+    instrumentation.current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        if current is None:
+            return "Error: The RAG system is not properly initialized. Please check your database and API key."
+
+        if not query or len(query.strip()) < 2:
+            return "Please provide a valid question about blockchain technologies."
+
+        if answer_cache_enabled:
+            cached = await asyncio.to_thread(answer_cache.get, query, version, embeddings.embed_query)
+            if cached is not None:
+                return cached
+
+        response = await get_runner().single_flight(
+            normalize(query), lambda: current.ainvoke(query, config={"callbacks": [trace]}))
+        if answer_cache_enabled and response:
+            await asyncio.to_thread(answer_cache.put, query, response, version, embeddings.embed_query)
         return response
     except Exception as e:
-        error_msg = str(e)
-        if "api_key" in error_msg.lower() or "apikey" in error_msg.lower():
-            return "Error: There seems to be an issue with the API key. Please check your GROQ_API_KEY in the .env file."
-        elif "timeout" in error_msg.lower() or "connection" in error_msg.lower():
-            return "Error: Could not connect to the GROQ API. Please check your internet connection."
+        instrumentation.errors.inc(stage="total", error=type(e).__name__)
+        return error_message(e)
+    finally:
+        trace.record("total", time.perf_counter() - started)
+
+def generate_async(query):
+    """Synchronous entry point for WSGI threads into the shared async serving loop.
+
+    The calling thread blocks until the answer arrives, so concurrency is still bounded by
+    the server's threads; the loop only caps upstream calls and coalesces duplicates.
+    """
+    return get_runner().submit(agenerate(query, instrumentation.active_trace()))
+
+batch_max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+def admitted_invoke(current, deadline, query, trace):
+    """One batch item: wait for rate budget right before the chain runs, then settle on real usage"""
+    item_trace = instrumentation.Trace()
+    permit = admission.admit(estimate_tokens(query), deadline)
+    try:
+        return current.invoke(query, config={"callbacks": [item_trace]})
+    finally:
+        # a relevance-gated item used no tokens and gets its request slot back
+        permit.settle(sum(item_trace.tokens.values()))
+        trace.merge(item_trace)
+
+def generate_batch(queries, max_concurrency=None, deadline=None):
+    """Answer many queries in order, returning {"response": ...} or {"error": ...} per item.
+
+    With admission control on, each item is admitted just before its own chain run, so
+    calls go upstream as budget refills instead of in one burst.
+    """
+    results = [None] * len(queries)
+    current, version = active_chain()
+    if current is None:
+        return [{"error": "The RAG system is not properly initialized. Please check your database and API key."}
+                for _ in queries]
+
+    todo = []
+    for i, query in enumerate(queries):
+        if not isinstance(query, str) or len(query.strip()) < 2:
+            results[i] = {"response": "Please provide a valid question about blockchain technologies."}
         else:
-            return f"Error generating response: {error_msg}"
+            todo.append(i)
+
+    if todo:
+        try:
+            # one model call embeds every query; the retriever then finds them in the cache
+            embeddings.embed_queries([queries[i] for i in todo])
+        except Exception as e:
+            print(f"Error embedding batch queries: {e}")
+
+    if answer_cache_enabled:
+        pending = []
+        for i in todo:
+            cached = answer_cache.get(queries[i], version, embeddings.embed_query)
+            if cached is not None:
+                results[i] = {"response": cached}
+            else:
+                pending.append(i)
+        todo = pending
+
+    if todo:
+        config = {"max_concurrency": max_concurrency or batch_max_concurrency}
+        trace = instrumentation.active_trace()
+        if admission.enabled:
+            runnable = RunnableLambda(partial(admitted_invoke, current, deadline, trace=trace))
+        else:
+            runnable = current
+            config["callbacks"] = [trace]
+        outputs = runnable.batch([queries[i] for i in todo], config=config, return_exceptions=True)
+        for i, output in zip(todo, outputs):
+            if isinstance(output, Exception):
+                instrumentation.errors.inc(stage="total", error=type(output).__name__)
+                message = error_message(output)
+                results[i] = {"error": message[7:] if message.startswith("Error:") else message}
+            else:
+                results[i] = {"response": output}
+                if answer_cache_enabled and output:
+                    answer_cache.put(queries[i], output, version, embeddings.embed_query)
+    return results
+
+def serving_stats():
+    return {"async": runner.snapshot() if runner is not None else None, "sync": flights.snapshot()}
+
+def generate_stream(query):
+    """Yield ("token", text) events as the chain produces them, then ("done", answer) or ("error", message)"""
+    current, version = active_chain()
+    trace = instrumentation.active_trace()
+    started = time.perf_counter()
+    try:
+        if current is None:
+            yield "error", "Error: The RAG system is not properly initialized. Please check your database and API key."
+            return
+
+        if not query or len(query.strip()) < 2:
+            yield "token", "Please provide a valid question about blockchain technologies."
+            yield "done", "Please provide a valid question about blockchain technologies."
+            return
+
+        if answer_cache_enabled:
+            cached = answer_cache.get(query, version, embeddings.embed_query)
+            if cached is not None:
+                yield "token", cached
+                yield "done", cached
+                return
+
+        parts = []
+        for token in current.stream(query, config={"callbacks": [trace]}):
+            if token:
+                parts.append(token)
+                yield "token", token
+        response = "".join(parts)
+        if answer_cache_enabled and response:
+            answer_cache.put(query, response, version, embeddings.embed_query)
+        yield "done", response
+    except Exception as e:
+        instrumentation.errors.inc(stage="total", error=type(e).__name__)
+        yield "error", error_message(e)
+    finally:
+        trace.record("total", time.perf_counter() - started)
 
 def chat(query):
     while query.lower() != "exit":
@@ -175,8 +667,9 @@ def main():
             print("Critical error: Failed to create and read database.")
             return
 
-    global chain
+    global chain, current_db
     chain = create_chain(db_path)
+    current_db = (db_path, db_version())
     print("Blockchain Knowledge Agent ready. Type 'exit' to quit.")
     query = input("Human: ")
     chat(query)
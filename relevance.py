@@ -0,0 +1,128 @@
+import time
+import threading
+from collections import OrderedDict
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from pydantic import ConfigDict
+
+import instrumentation
+from context_packing import DEFAULT_CONTEXT_BUDGET, approx_tokens
+
+NO_INFORMATION = ("I don't have specific information about this in my knowledge base, but I'd be happy "
+                  "to discuss other aspects of blockchain technology or answer related questions.")
+SCORE_KEY = "relevance_score"
+# best vector score of the whole query, stamped before fusion can drop the hit that had it
+BEST_SCORE_KEY = "best_relevance_score"
+# BM25 score over the query's total idf, in [0, 1]: roughly the share of the query's rare terms matched
+KEYWORD_SCORE_KEY = "keyword_score"
+# days of savings kept for /relevance/stats
+HISTORY_DAYS = 30
+
+llm_calls_saved = instrumentation.Counter("rag_llm_calls_saved_total",
+                                          "LLM calls answered without the model because nothing relevant was retrieved")
+tokens_saved = instrumentation.Counter("rag_llm_tokens_saved_total",
+                                       "Estimated LLM tokens not sent, by reason", ["reason"])
+instrumentation.METRICS.extend([llm_calls_saved, tokens_saved])
+
+
+def cosine_relevance(distance):
+    """Chroma's squared L2 distance between unit vectors as (cosine + 1) / 2, the numpy store's scale"""
+    return 1.0 - distance / 4.0
+
+
+class ScoredRetriever(BaseRetriever):
+    """Vector retrieval through similarity_search_with_relevance_scores; each hit's score goes in its metadata"""
+
+    vectorstore: VectorStore
+    k: int = 4
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        return [doc.model_copy(update={"metadata": dict(doc.metadata, **{SCORE_KEY: score})})
+                for doc, score in self.vectorstore.similarity_search_with_relevance_scores(query, k=self.k)]
+
+
+def best_score(docs, keys=(SCORE_KEY, BEST_SCORE_KEY)):
+    scores = [d.metadata[key] for d in docs for key in keys if key in d.metadata]
+    return max(scores) if scores else None
+
+
+class RelevanceGate:
+    """Skips the LLM when no retrieved chunk reaches threshold, and trims weak chunks from the context.
+
+    Scores are relevance scores in [0, 1]. Chunks without one (BM25-only hits) are never
+    trimmed. A keyword hit keeps the LLM call only when its keyword score reaches
+    keyword_threshold, so stopword matches cannot hold the gate open. Savings are counted per day.
+    """
+
+    def __init__(self, threshold=0.0, margin=0.0, context_budget=DEFAULT_CONTEXT_BUDGET, keyword_threshold=0.5):
+        self.threshold = threshold
+        self.keyword_threshold = keyword_threshold
+        self.margin = margin
+        self.context_budget = context_budget
+        self.lock = threading.Lock()
+        self.days = OrderedDict()
+
+    def count(self, **amounts):
+        day = time.strftime("%Y-%m-%d")
+        with self.lock:
+            if day not in self.days:
+                if self.days:
+                    last, stats = next(reversed(self.days.items()))
+                    print(f"LLM savings on {last}: {stats['llm_calls_saved']} of {stats['queries']} calls skipped, "
+                          f"~{stats['tokens_saved']} tokens saved, {stats['chunks_trimmed']} chunks trimmed")
+                self.days[day] = {"queries": 0, "llm_calls_saved": 0, "tokens_saved": 0, "chunks_trimmed": 0}
+                while len(self.days) > HISTORY_DAYS:
+                    self.days.popitem(last=False)
+            for key, n in amounts.items():
+                self.days[day][key] += n
+
+    def trim(self, docs):
+        """Drop scored chunks below threshold or more than margin below the best one"""
+        best = best_score(docs)
+        if best is None or (not self.margin and not self.threshold) or best < self.threshold:
+            return docs
+        floor = max(self.threshold, best - self.margin) if self.margin else self.threshold
+        kept, dropped = [], []
+        for d in docs:
+            (kept if d.metadata.get(SCORE_KEY, floor) >= floor else dropped).append(d)
+        if dropped:
+            saved = sum(approx_tokens(d.page_content) for d in dropped)
+            tokens_saved.inc(saved, reason="trimmed")
+            self.count(chunks_trimmed=len(dropped), tokens_saved=saved)
+        return kept
+
+    def irrelevant(self, inputs):
+        """True when the gate is on and the retrieved chunks give the LLM nothing to work with"""
+        self.count(queries=1)
+        if self.threshold <= 0:
+            return False
+        docs = inputs["docs"]
+        if not docs:
+            return True
+        # a strong keyword hit is an exact match on the query's rare terms (a ticker, an EIP)
+        keyword = best_score(docs, (KEYWORD_SCORE_KEY,))
+        if keyword is not None and keyword >= self.keyword_threshold:
+            return False
+        best = best_score(docs)
+        if best is not None:
+            return best < self.threshold
+        # only weak keyword hits decline; hits from a retriever without scores keep the call
+        return keyword is not None
+
+    def decline(self, inputs, prompt_tokens=0):
+        """The canned no-information answer, counting the call and the tokens it would have cost"""
+        context = min(self.context_budget, sum(approx_tokens(d.page_content) for d in inputs["docs"]))
+        saved = prompt_tokens + approx_tokens(inputs["question"]) + context + approx_tokens(NO_INFORMATION)
+        llm_calls_saved.inc()
+        tokens_saved.inc(saved, reason="skipped")
+        self.count(llm_calls_saved=1, tokens_saved=saved)
+        return NO_INFORMATION
+
+    def snapshot(self):
+        with self.lock:
+            days = {day: dict(stats) for day, stats in self.days.items()}
+        return {"threshold": self.threshold, "margin": self.margin, "keyword_threshold": self.keyword_threshold,
+                "days": days}
@@ -6,10 +6,27 @@ import importlib
 import importlib.util
 import platform
 import traceback
+from contextlib import contextmanager
 
 # Set the working directory to the script's directory
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
+# seconds spent in each startup phase, printed before the server starts
+startup_profile = {}
+run_started = time.perf_counter()
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_profile[name] = startup_profile.get(name, 0.0) + time.perf_counter() - started
+
+def print_startup_profile():
+    print("Startup profile: " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in startup_profile.items())
+          + f", total {(time.perf_counter() - run_started) * 1000:.0f} ms")
+
 def get_python_path():
     """Get the correct Python executable path"""
     return sys.executable
@@ -55,19 +72,19 @@ def print_diagnostics():
 
 def check_dependencies():
     """Check if required packages are installed"""
-    required_packages = ["flask", "langchain_chroma", "langchain_groq", "langchain_core", 
+    required_packages = ["flask", "langchain_chroma", "httpx", "langchain_core", 
                          "langchain_text_splitters", "langchain_community", "langchain_huggingface",
                          "python-dotenv", "chromadb"]
+    # pip names whose import name differs
+    import_names = {"python-dotenv": "dotenv"}
     missing_packages = []
     
     print("Checking required packages...")
     for package in required_packages:
-        try:
-            # Handle packages with dashes that use underscores in import
-            import_name = package.replace("-", "_")
-            importlib.import_module(import_name)
+        # find_spec locates the package without importing it; the app imports what it needs later
+        if importlib.util.find_spec(import_names.get(package, package)) is not None:
             print(f"  ✓ {package} installed")
-        except ImportError:
+        else:
             missing_packages.append(package)
             print(f"  ✗ {package} missing")
     
@@ -97,8 +114,25 @@ def check_dependencies():
     print("All required packages are installed.")
     return True
 
-def check_database():
-    """Check if the database has been initialized properly"""
+def prepare_books():
+    """Make sure books/ exists and has something to ingest"""
+    books_dir = os.path.join(os.getcwd(), "books")
+    if not os.path.exists(books_dir):
+        print("Books directory not found. Creating it...")
+        os.makedirs(books_dir)
+        
+    # Check if there are any txt files in the books directory
+    txt_files = [f for f in os.listdir(books_dir) if f.endswith('.txt')]
+    if not txt_files:
+        print("No text files found in books directory. Creating sample files...")
+        create_sample_files(books_dir)
+
+def check_database(background=False):
+    """Check if the database has been initialized properly.
+
+    With background=True a missing database is built on a thread of this process while the
+    server starts; rag.py waits for it before opening the index.
+    """
     try:
         db_path = os.path.join(os.getcwd(), "db")
         if not os.path.exists(db_path):
@@ -120,6 +154,14 @@ def check_database():
             except Exception as e:
                 print(f"Error reading database path: {e}")
         
+        if not db_exists and background:
+            print("Database not initialized. Running ingestion in the background...")
+            prepare_books()
+            with phase("import_ingestion"):
+                import my_langchain
+            my_langchain.ingest_in_background()
+            return True
+
         if not db_exists:
             print("Database not initialized. Running ingestion script...")
             python_path = get_python_path()
@@ -129,17 +171,7 @@ def check_database():
                     print("Error: my_langchain.py not found!")
                     return False
                 
-                # Check if books directory exists
-                books_dir = os.path.join(os.getcwd(), "books")
-                if not os.path.exists(books_dir):
-                    print("Books directory not found. Creating it...")
-                    os.makedirs(books_dir)
-                    
-                # Check if there are any txt files in the books directory
-                txt_files = [f for f in os.listdir(books_dir) if f.endswith('.txt')]
-                if not txt_files:
-                    print("No text files found in books directory. Creating sample files...")
-                    create_sample_files(books_dir)
+                prepare_books()
                 
                 print(f"Running: {python_path} my_langchain.py")
                 result = subprocess.run([python_path, "my_langchain.py"], 
@@ -225,7 +257,7 @@ Solana features ultra-low transaction costs and sub-second settlement times.""")
         print(f"Error creating sample files: {e}")
         traceback.print_exc()
 
-def run_app():
+def run_app(production=False, fast=False):
     """Run the Flask application"""
     try:
         # Check if we have a RAG module that works
@@ -250,12 +282,24 @@ def run_app():
             print("Please make sure the UI template exists before continuing.")
             return False
         
+        if production:
+            # preforked workers sharing one preloaded model and index; see serve.py
+            with phase("import_server"):
+                from serve import serve
+            print_startup_profile()
+            serve(host=os.getenv("WEB_HOST", "127.0.0.1"), port=int(os.getenv("WEB_PORT", "5000")),
+                  workers=int(os.getenv("WEB_WORKERS", "2")), threads=int(os.getenv("WEB_THREADS", "8")))
+            return True
+
         # Try to import the app
         try:
-            from app import app
+            with phase("import_app"):
+                from app import app
+            print_startup_profile()
             print("Starting the Blockchain Knowledge Agent UI...")
             print("Access the UI in your browser at: http://localhost:5000")
-            app.run(debug=True, port=5000)
+            # the reloader would start a second process that loads everything again
+            app.run(debug=True, port=5000, use_reloader=not fast)
             return True
         except ImportError as e:
             print(f"Error importing Flask app: {e}")
@@ -277,18 +321,25 @@ def run_app():
 if __name__ == "__main__":
     print("\n=== Blockchain Knowledge Agent ===")
     print("Initializing system...")
+    # --fast: ingest in-process in the background while the server starts, without the reloader
+    fast = "--fast" in sys.argv[1:]
     
     # Print diagnostics to help troubleshoot issues
-    print_diagnostics()
+    with phase("diagnostics"):
+        print_diagnostics()
     
-    if not check_dependencies():
+    with phase("dependencies"):
+        dependencies_ok = check_dependencies()
+    if not dependencies_ok:
         print("Failed to verify dependencies.")
         sys.exit(1)
         
-    if not check_database():
+    with phase("database"):
+        database_ok = check_database(background=fast)
+    if not database_ok:
         print("Failed to initialize database.")
         sys.exit(1)
         
-    if not run_app():
+    if not run_app(production="--production" in sys.argv[1:], fast=fast):
         print("Failed to start the web application.")
         sys.exit(1) 
\ No newline at end of file
@@ -0,0 +1,151 @@
+import os
+import gc
+import sys
+import time
+import errno
+import signal
+import socket
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server handling connections on a fixed-size thread pool"""
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def rss_mb(pid="self"):
+    """Resident and proportional set size in MB; PSS splits shared pages between their users"""
+    sizes = {}
+    for name, key in (("smaps_rollup", "Pss:"), ("status", "VmRSS:")):
+        try:
+            with open(f"/proc/{pid}/{name}") as f:
+                for line in f:
+                    if line.startswith(key):
+                        sizes[key.rstrip(":").lower()] = int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return sizes.get("vmrss", 0.0), sizes.get("pss", 0.0)
+
+
+def preload(watch_interval):
+    """Import the app and block until the model is loaded and the index is open and warm"""
+    # the master never serves, so it must not poll latest_db.txt; workers do after forking
+    os.environ["INDEX_WATCH_INTERVAL"] = "0"
+    # tokenizers' thread pool does not survive fork
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    import app as web
+    web.wait_until_ready()
+    os.environ["INDEX_WATCH_INTERVAL"] = str(watch_interval)
+    print(f"Preloaded RAG stack ({web.startup['state']}), master RSS {rss_mb()[0]:.0f} MB")
+    return web
+
+
+def run_worker(web, sock, threads, workers, watch_interval):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if "torch" in sys.modules:
+        # one intra-op thread pool per worker, sized so workers do not oversubscribe the CPUs
+        sys.modules["torch"].set_num_threads(max(1, (os.cpu_count() or 1) // max(1, workers)))
+    if web.rag_module is not None and hasattr(web.rag_module, "after_fork"):
+        web.rag_module.after_fork(watch_interval, workers)
+    host, port = sock.getsockname()[:2]
+    server = PooledWSGIServer(host, port, web.app, threads, fd=sock.fileno())
+    print(f"Worker {os.getpid()} serving with {threads} threads")
+    server.serve_forever()
+
+
+def serve(host="127.0.0.1", port=5000, workers=2, threads=8, watch_interval=None):
+    """Preload the RAG stack once, then fork workers that share its pages copy-on-write.
+
+    With workers=0, or where fork is unavailable, the master serves by itself.
+    """
+    if watch_interval is None:
+        watch_interval = float(os.getenv("INDEX_WATCH_INTERVAL", "5"))
+    sock = socket.create_server((host, port), backlog=2048)
+    sock.set_inheritable(True)
+    web = preload(watch_interval)
+
+    if workers <= 0 or not hasattr(os, "fork"):
+        if workers > 0:
+            print("fork() is not available on this platform; serving from a single process.")
+        if web.rag_module is not None and hasattr(web.rag_module, "watch_index"):
+            web.rag_module.watch_index(watch_interval)
+        server = PooledWSGIServer(host, port, web.app, threads, fd=sock.fileno())
+        print(f"Serving on http://{host}:{port} with {threads} threads")
+        server.serve_forever()
+        return
+
+    # objects created so far are never collected; keeps the collector from dirtying shared pages
+    gc.freeze()
+    children = {}
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(web, sock, threads, workers, watch_interval)
+            finally:
+                os._exit(1)
+        children[pid] = slot
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(workers):
+        spawn(slot)
+    print(f"Serving on http://{host}:{port} with {workers} workers x {threads} threads")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            break
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"Worker {pid} exited with status {status}; restarting")
+            time.sleep(1)
+            spawn(slot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the web app from preforked workers sharing one preloaded model and index")
+    parser.add_argument("--host", default=os.getenv("WEB_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("WEB_PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "2")),
+                        help="worker processes (0 serves from the master process)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "8")),
+                        help="request threads per worker")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,7 @@ call venv\Scripts\activate.bat
 
 :: Install required packages
 python -m pip install --upgrade pip
-pip install langchain-text-splitters langchain-community langchain-core langchain-chroma chromadb langchain-huggingface sentence-transformers langchain-groq python-dotenv
+pip install langchain-text-splitters langchain-community langchain-core langchain-chroma chromadb langchain-huggingface sentence-transformers httpx python-dotenv
 
 echo Environment setup complete!
 echo Please run: venv\Scripts\activate.bat
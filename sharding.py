@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import fnmatch
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from bm25_index import reciprocal_rank_fusion
+from relevance import SCORE_KEY
+from vector_index import NumpyVectorStore, unit_rows
+
+SHARDS_MANIFEST = "shards.json"
+SHARDS_DIR = "shards"
+DEFAULT_SHARD = "general"
+# topic -> file name patterns it is built from, and query keywords that route to it
+DEFAULT_SHARD_MAP = {
+    "bitcoin": {"files": ["bitcoin*", "btc*"],
+                "keywords": ["bitcoin", "btc", "satoshi", "proof of work", "proof-of-work", "halving", "utxo",
+                             "lightning network"]},
+    "ethereum": {"files": ["eth*", "eip*", "erc*"],
+                 "keywords": ["ethereum", "ether", "eth", "evm", "smart contract", "smart contracts", "solidity",
+                              "gas", "eip", "erc20", "erc-20", "proof of stake", "proof-of-stake", "casper"]},
+    "solana": {"files": ["sol*"],
+               "keywords": ["solana", "sol", "proof of history", "proof-of-history", "poh", "sealevel",
+                            "tower bft", "turbine", "gulf stream"]},
+}
+
+
+def load_shard_map(path=None):
+    """Shard mapping from a JSON file (SHARD_MAP) in the DEFAULT_SHARD_MAP format, else the default"""
+    path = path or os.getenv("SHARD_MAP")
+    if not path:
+        return DEFAULT_SHARD_MAP
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def shard_for(name, shard_map):
+    """The first shard whose file patterns match the file's name, else DEFAULT_SHARD"""
+    base = os.path.basename(name).lower()
+    for shard, rules in shard_map.items():
+        if any(fnmatch.fnmatch(base, pattern.lower()) for pattern in rules.get("files", [])):
+            return shard
+    return DEFAULT_SHARD
+
+
+def group_files(files, shard_map):
+    groups = {}
+    for name in files:
+        groups.setdefault(shard_for(name, shard_map), []).append(name)
+    return groups
+
+
+def store_centroid(db, batch_size=256):
+    """Normalized mean of a store's unit-normalized vectors, read back without embedding anything"""
+    if isinstance(db, NumpyVectorStore):
+        if db.matrix is None:
+            return None
+        total = np.zeros(db.dim, dtype=np.float64)
+        for start in range(0, db.count, 65536):
+            total += np.asarray(db.matrix[start:start + 65536], dtype=np.float32).sum(axis=0)
+    else:
+        total, offset = None, 0
+        while True:
+            page = db.get(include=["embeddings"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            rows = unit_rows(page["embeddings"]).sum(axis=0)
+            total = rows if total is None else total + rows
+            offset += len(page["ids"])
+        if total is None:
+            return None
+    norm = np.linalg.norm(total)
+    return (total / norm).tolist() if norm else None
+
+
+def read_manifest(persist_dir):
+    path = os.path.join(persist_dir, SHARDS_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    for entry in manifest["shards"].values():
+        entry["path"] = os.path.normpath(os.path.join(persist_dir, entry["dir"]))
+    return manifest
+
+
+def write_manifest(persist_dir, shards):
+    os.makedirs(persist_dir, exist_ok=True)
+    entries = {name: {k: v for k, v in entry.items() if k != "path"} for name, entry in shards.items()}
+    with open(os.path.join(persist_dir, SHARDS_MANIFEST), "w") as f:
+        json.dump({"shards": entries}, f)
+
+
+class ShardRouter:
+    """Picks the shards to search for a query.
+
+    "keywords" uses each shard's keyword rules, "centroid" compares the query embedding
+    with each shard's mean vector, "auto" uses keywords and falls back to centroids when
+    none match, and "all" searches every shard.
+    """
+
+    def __init__(self, shards, mode="auto", max_shards=2, margin=0.05):
+        self.names = list(shards)
+        self.mode = mode
+        self.max_shards = max_shards
+        self.margin = margin
+        self.patterns = {}
+        for name, entry in shards.items():
+            keywords = entry.get("keywords") or []
+            if keywords:
+                self.patterns[name] = re.compile(r"\b(?:" + "|".join(re.escape(k.lower()) for k in keywords) + r")\b")
+        with_centroid = [name for name in self.names if shards[name].get("centroid")]
+        self.centroid_names = with_centroid
+        self.centroids = unit_rows([shards[name]["centroid"] for name in with_centroid]) if with_centroid else None
+
+    def by_keywords(self, query):
+        text = query.lower()
+        return [name for name, pattern in self.patterns.items() if pattern.search(text)]
+
+    def by_centroid(self, vector):
+        if self.centroids is None:
+            return list(self.names)
+        sims = self.centroids @ unit_rows([vector])[0]
+        order = np.argsort(-sims)
+        best = sims[order[0]]
+        return [self.centroid_names[i] for i in order[:self.max_shards] if sims[i] >= best - self.margin]
+
+    def route(self, query, embed):
+        if self.mode == "all" or len(self.names) <= 1:
+            return list(self.names)
+        if self.mode in ("keywords", "auto"):
+            matched = self.by_keywords(query)
+            if matched or self.mode == "keywords":
+                return matched or list(self.names)
+        return self.by_centroid(embed(query))
+
+
+class ShardedRetriever(BaseRetriever):
+    """Searches only the routed shards, in parallel, and merges their hits into one top-k.
+
+    Hits carrying relevance scores are merged by score; otherwise shard rankings are
+    interleaved by rank with reciprocal rank fusion.
+    """
+
+    retrievers: dict
+    router: ShardRouter
+    embeddings: Embeddings
+    k: int = 4
+    pool: ThreadPoolExecutor
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        names = self.router.route(query, self.embeddings.embed_query)
+        if len(names) > 1:
+            # embed once up front; every shard's vector search then hits the embedding cache
+            self.embeddings.embed_query(query)
+
+        def search(name):
+            docs = self.retrievers[name].invoke(query, config={"callbacks": run_manager.get_child()})
+            return [d.model_copy(update={"metadata": dict(d.metadata, shard=name)}) for d in docs]
+
+        if len(names) == 1:
+            rankings = [search(names[0])]
+        else:
+            # worker threads do not inherit context variables (the request's trace) on their own
+            futures = [self.pool.submit(contextvars.copy_context().run, search, name) for name in names]
+            rankings = [f.result() for f in futures]
+        hits = [d for ranking in rankings for d in ranking]
+        if hits and all(SCORE_KEY in d.metadata for d in hits):
+            return sorted(hits, key=lambda d: d.metadata[SCORE_KEY], reverse=True)[:self.k]
+        return reciprocal_rank_fusion(rankings, self.k)
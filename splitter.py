@@ -0,0 +1,150 @@
+import os
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import accumulate, repeat
+from operator import add
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+SEPARATORS = ["\n\n", "\n", " ", ""]
+# documents shorter than this are split inline; shipping them to a worker costs more than splitting
+PARALLEL_MIN_CHARS = 100_000
+
+
+def strip_span(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+class FastSplitter:
+    """Drop-in for RecursiveCharacterTextSplitter with the default keep_separator and strip_whitespace.
+
+    Chunks are the same strings, but splits are kept as a list of cut offsets into the
+    original text. Piece lengths come from one str.split per separator level (in C), chunk
+    boundaries are found by bisecting the cuts instead of walking every piece, and text is
+    only copied once, for the final chunks.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, separators=None):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators or SEPARATORS)
+
+    def merge(self, text, cuts, lo, hi, out):
+        """Pack pieces lo..hi-1 (piece i is text[cuts[i]:cuts[i + 1]]) like TextSplitter._merge_splits"""
+        while lo < hi and cuts[lo] == cuts[lo + 1]:
+            lo += 1
+        if lo >= hi:
+            return
+        size, overlap = self.chunk_size, self.chunk_overlap
+        # the window holds pieces first..nxt-1 and is always within chunk_size
+        first, nxt = lo, lo + 1
+        while True:
+            # the first piece that would push the window past chunk_size
+            t = bisect_right(cuts, cuts[first] + size, nxt + 1, hi + 1)
+            if t > hi:
+                out.append(strip_span(text, cuts[first], cuts[hi]))
+                return
+            j = t - 1
+            out.append(strip_span(text, cuts[first], cuts[j]))
+            # drop pieces from the front until at most chunk_overlap is left and piece j fits
+            keep_overlap = bisect_left(cuts, cuts[j] - overlap, first, j + 1)
+            make_room = bisect_left(cuts, cuts[j + 1] - size, first, j + 1)
+            first, nxt = max(keep_overlap, min(make_room, j)), j + 1
+
+    def split(self, text, start, end, separators, out):
+        separator, rest = separators[-1], []
+        for i, sep in enumerate(separators):
+            if sep == "":
+                separator = sep
+                break
+            if text.find(sep, start, end) != -1:
+                separator, rest = sep, separators[i + 1:]
+                break
+
+        if separator == "":
+            cuts = range(start, end + 1)
+            oversized = []
+        else:
+            span = text if (start, end) == (0, len(text)) else text[start:end]
+            lengths = list(map(len, span.split(separator)))
+            # the separator stays at the start of the piece that follows it
+            lengths[1:] = map(add, lengths[1:], repeat(len(separator)))
+            cuts = list(accumulate(lengths, initial=start))
+            oversized = ([i for i, n in enumerate(lengths) if n >= self.chunk_size]
+                         if max(lengths) >= self.chunk_size else [])
+
+        lo = 0
+        for i in oversized:
+            self.merge(text, cuts, lo, i, out)
+            if rest:
+                self.split(text, cuts[i], cuts[i + 1], rest, out)
+            else:
+                out.append((cuts[i], cuts[i + 1]))
+            lo = i + 1
+        self.merge(text, cuts, lo, len(cuts) - 1, out)
+
+    def spans(self, text):
+        """(start, end) offsets of each chunk in text"""
+        out = []
+        if text:
+            self.split(text, 0, len(text), self.separators, out)
+        return [(a, b) for a, b in out if b > a]
+
+    def split_text(self, text):
+        return [text[a:b] for a, b in self.spans(text)]
+
+    def documents(self, doc, spans):
+        return [Document(page_content=doc.page_content[a:b], metadata=dict(doc.metadata, start_index=a))
+                for a, b in spans]
+
+    def split_documents(self, docs):
+        chunks = []
+        for doc in docs:
+            chunks.extend(self.documents(doc, self.spans(doc.page_content)))
+        return chunks
+
+
+def split_spans(text, chunk_size, chunk_overlap, separators):
+    return FastSplitter(chunk_size, chunk_overlap, separators).spans(text)
+
+
+def iter_split(docs, splitter=None, workers=None):
+    """Yield the chunks of each document in order, splitting large documents in a process pool.
+
+    Workers get the text and return only offsets; chunks are cut from the parent's copy.
+    """
+    splitter = splitter or FastSplitter()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for doc in docs:
+            yield from splitter.documents(doc, splitter.spans(doc.page_content))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def drain(limit):
+            while len(pending) > limit:
+                doc, spans = pending.popleft()
+                yield from splitter.documents(doc, spans.result() if hasattr(spans, "result") else spans)
+
+        for doc in docs:
+            text = doc.page_content
+            if len(text) >= PARALLEL_MIN_CHARS:
+                spans = pool.submit(split_spans, text, splitter.chunk_size, splitter.chunk_overlap,
+                                    splitter.separators)
+            else:
+                spans = splitter.spans(text)
+            pending.append((doc, spans))
+            yield from drain(workers * 2)
+        yield from drain(0)
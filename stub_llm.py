@@ -0,0 +1,64 @@
+import time
+import asyncio
+import hashlib
+import threading
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+WORDS = ["blocks", "are", "chained", "by", "hashes", "and", "validators", "reach", "consensus",
+         "on", "the", "ledger", "state", "while", "fees", "pay", "for", "execution"]
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic offline chat model with simulated latency.
+
+    The answer depends only on the prompt text. `latency` is the time to first token and
+    `tokens_per_second` paces the rest, for both the sync and async paths.
+    """
+
+    latency: float = 0.2
+    tokens_per_second: float = 200.0
+    answer_tokens: int = 40
+    calls: int = 0
+    lock: object = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def tokens(self, messages):
+        prompt = "".join(str(m.content) for m in messages)
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+        return [WORDS[(seed >> (i % 200)) % len(WORDS)] + " " for i in range(self.answer_tokens)]
+
+    def count(self):
+        with self.lock:
+            self.calls += 1
+
+    def duration(self):
+        return self.latency + self.answer_tokens / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.count()
+        time.sleep(self.duration())
+        text = "".join(self.tokens(messages)).strip()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.count()
+        await asyncio.sleep(self.duration())
+        text = "".join(self.tokens(messages)).strip()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.count()
+        time.sleep(self.latency)
+        for token in self.tokens(messages):
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,56 @@
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bm25_index import BM25Index, BM25Writer, HybridRetriever, tokenize
+from relevance import ScoredRetriever
+from vector_index import NumpyVectorStore, VectorIndexWriter
+
+
+class BagOfWords(Embeddings):
+    """Hashed word counts: texts that share words are close"""
+
+    def embed(self, text):
+        vector = np.zeros(128, dtype=np.float32)
+        for token in tokenize(text):
+            vector[zlib.crc32(token.encode()) % 128] += 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self.embed(text)
+
+
+@pytest.fixture
+def embeddings():
+    return BagOfWords()
+
+
+@pytest.fixture
+def make_hybrid(tmp_path, embeddings):
+    """Builds a numpy store and a BM25 index over texts and returns a HybridRetriever on them"""
+
+    def make(texts, name="index", k=2, fetch_k=4):
+        path = tmp_path / name
+        docs = [Document(page_content=t, metadata={"source": f"{name}{i}"}) for i, t in enumerate(texts)]
+        ids = [f"{name}-{i}" for i in range(len(docs))]
+        writer = VectorIndexWriter(str(path))
+        writer.add(docs, ids, embeddings.embed_documents(texts))
+        writer.close()
+        bm25 = BM25Writer(str(path / "bm25.sqlite"))
+        bm25.add(docs, ids)
+        bm25.close()
+        dense = ScoredRetriever(vectorstore=NumpyVectorStore(str(path), embeddings), k=4)
+        return HybridRetriever(vector_retriever=dense, index=BM25Index(str(path / "bm25.sqlite")), k=k,
+                               fetch_k=fetch_k)
+
+    return make
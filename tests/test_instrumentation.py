@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from sharding import ShardedRetriever, ShardRouter
+
+BITCOIN = [
+    "bitcoin miners search for a nonce so the block hash is below the target",
+    "the bitcoin halving cuts the block subsidy every 210000 blocks",
+    "a utxo is an unspent output that a bitcoin transaction can spend",
+]
+ETHEREUM = [
+    "ethereum gas pays for each step the evm executes",
+    "an erc20 token contract keeps balances and allowances",
+    "the ethereum base fee is burned under eip-1559",
+]
+
+
+def observations(histogram, **labels):
+    key = tuple((name, labels.get(name, "")) for name in histogram.labelnames)
+    return histogram.series.get(key, {}).get("count", 0)
+
+
+def test_sharded_hybrid_retrieval_is_traced_once(make_hybrid, embeddings):
+    shards = {"bitcoin": {"keywords": ["bitcoin"]}, "ethereum": {"keywords": ["ethereum"]}}
+    retriever = ShardedRetriever(
+        retrievers={"bitcoin": make_hybrid(BITCOIN, "bitcoin", k=4), "ethereum": make_hybrid(ETHEREUM, "ethereum", k=4)},
+        router=ShardRouter(shards, mode="all"), embeddings=embeddings, k=4, pool=ThreadPoolExecutor(2))
+    retrieves = observations(instrumentation.stage_seconds, stage="retrieve")
+    chunk_counts = observations(instrumentation.retrieved_chunks)
+
+    trace = instrumentation.Trace()
+    docs = retriever.invoke("bitcoin and ethereum blocks", config={"callbacks": [trace]})
+
+    assert len(docs) == 4
+    assert observations(instrumentation.stage_seconds, stage="retrieve") == retrieves + 1
+    assert observations(instrumentation.retrieved_chunks) == chunk_counts + 1
+    assert trace.chunks == 4
+    assert list(trace.timings) == ["retrieve"]
+    assert not trace.started and not trace.parents
@@ -0,0 +1,43 @@
+import pytest
+
+from relevance import BEST_SCORE_KEY, KEYWORD_SCORE_KEY, RelevanceGate
+
+TEXTS = [
+    "the base fee is burned under eip-1559 and the tip goes to the validator",
+    "the erc20 standard is the interface that most tokens on ethereum implement",
+    "the beacon chain is where validators attest to blocks and the fork choice",
+    "the mempool is where pending transactions wait and the gas price is set",
+    "the merkle patricia trie is how the state of the chain is stored",
+    "the rollup posts its batches to the chain and the proofs are checked",
+]
+
+
+@pytest.fixture
+def retriever(make_hybrid):
+    return make_hybrid(TEXTS)
+
+
+def gate_declines(retriever, query, threshold=0.75):
+    gate = RelevanceGate(threshold=threshold)
+    return gate.irrelevant({"question": query, "docs": retriever.invoke(query)})
+
+
+def test_stopword_match_does_not_keep_the_llm_call(retriever):
+    docs = retriever.invoke("what is the weather in paris")
+    assert docs and all(d.metadata[KEYWORD_SCORE_KEY] < 0.5 for d in docs if KEYWORD_SCORE_KEY in d.metadata)
+    assert gate_declines(retriever, "what is the weather in paris")
+
+
+def test_exact_term_match_keeps_the_llm_call(retriever):
+    docs = retriever.invoke("erc20")
+    assert docs[0].metadata[KEYWORD_SCORE_KEY] >= 0.5
+    # the dense score alone would decline it
+    assert not gate_declines(retriever, "erc20", threshold=0.99)
+
+
+def test_dense_score_is_taken_before_fusion(retriever):
+    dense = retriever.vector_retriever.invoke("validators attest to blocks")
+    fused = retriever.invoke("validators attest to blocks")
+    best = max(d.metadata["relevance_score"] for d in dense)
+    assert all(d.metadata[BEST_SCORE_KEY] == best for d in fused)
+    assert not gate_declines(retriever, "validators attest to blocks")
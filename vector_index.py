@@ -0,0 +1,234 @@
+import os
+import json
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_META = "vectors.json"
+VECTORS_FILE = "vectors.bin"
+INT8_FILE = "vectors.int8"
+SCALES_FILE = "scales.bin"
+BITS_FILE = "vectors.bits"
+DOCS_FILE = "docs.sqlite"
+SCAN_BLOCK = 65536
+# candidates rescored per requested result; sign bits need a much wider net than int8
+OVERSAMPLE = {"int8": 4, "binary": 50}
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_int8(matrix):
+    """Per-row symmetric int8 codes and float32 scales, so row ~= codes * scale"""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(matrix):
+    """One sign bit per dimension, packed eight to a byte"""
+    return np.packbits(matrix > 0, axis=1)
+
+
+class VectorIndexWriter:
+    """Appends unit-normalized vectors to one contiguous matrix file plus an id/metadata sidecar.
+
+    With quantization="int8" or "binary" compact codes are written as well; searches scan
+    the codes and only read full-precision rows for the candidates they rescore.
+
+    Every file is written under a temporary name and renamed into place on close, so a
+    server that has the previous files memory-mapped keeps reading their old inodes.
+    """
+
+    def __init__(self, persist_dir, dtype="float32", quantization=None):
+        os.makedirs(persist_dir, exist_ok=True)
+        self.persist_dir = persist_dir
+        self.dtype = np.dtype(dtype)
+        self.quantization = quantization
+        self.count = 0
+        self.dim = None
+        self.written = []
+        self.vectors = open(self.temp_path(VECTORS_FILE), "wb")
+        self.codes = self.scales = None
+        if quantization == "int8":
+            self.codes = open(self.temp_path(INT8_FILE), "wb")
+            self.scales = open(self.temp_path(SCALES_FILE), "wb")
+        elif quantization == "binary":
+            self.codes = open(self.temp_path(BITS_FILE), "wb")
+        docs_path = self.temp_path(DOCS_FILE)
+        if os.path.exists(docs_path):
+            os.remove(docs_path)
+        self.conn = sqlite3.connect(docs_path)
+        self.conn.execute("CREATE TABLE docs (idx INTEGER PRIMARY KEY, id TEXT, text TEXT, metadata TEXT)")
+
+    def temp_path(self, name):
+        self.written.append(name)
+        return os.path.join(self.persist_dir, name + ".tmp")
+
+    def add(self, docs, ids, vectors):
+        matrix = unit_rows(vectors)
+        if self.dim is None:
+            self.dim = matrix.shape[1]
+        self.vectors.write(matrix.astype(self.dtype).tobytes())
+        if self.quantization == "int8":
+            codes, scales = quantize_int8(matrix)
+            self.codes.write(codes.tobytes())
+            self.scales.write(scales.tobytes())
+        elif self.quantization == "binary":
+            self.codes.write(quantize_binary(matrix).tobytes())
+        self.conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", [
+            (self.count + i, doc_id, doc.page_content, json.dumps(doc.metadata))
+            for i, (doc, doc_id) in enumerate(zip(docs, ids))
+        ])
+        self.count += len(docs)
+
+    def update_metadata(self, updates):
+        """Merge {idx: metadata} into rows already written"""
+        for idx, meta in updates.items():
+            row = self.conn.execute("SELECT metadata FROM docs WHERE idx = ?", (idx,)).fetchone()
+            if row:
+                self.conn.execute("UPDATE docs SET metadata = ? WHERE idx = ?",
+                                  (json.dumps(dict(json.loads(row[0]), **meta)), idx))
+
+    def close(self):
+        for f in (self.vectors, self.codes, self.scales):
+            if f is not None:
+                f.close()
+        self.conn.commit()
+        self.conn.close()
+        # the meta file is renamed in last, so a half-written index is never opened
+        with open(self.temp_path(VECTORS_META), "w") as f:
+            json.dump({"count": self.count, "dim": self.dim or 0, "dtype": self.dtype.name,
+                       "quantization": self.quantization}, f)
+        for name in self.written:
+            os.replace(os.path.join(self.persist_dir, name + ".tmp"), os.path.join(self.persist_dir, name))
+        print(f"---created numpy index: {self.count} vectors, {self.dtype.name}"
+              f"{', ' + self.quantization if self.quantization else ''}---")
+
+
+class NumpyVectorStore(VectorStore):
+    """Read-only vector store over a memory-mapped matrix.
+
+    Pages of the matrix file are shared between every process that maps it. Search is
+    one matrix-vector product followed by argpartition top-k. Quantized indexes scan the
+    int8 or binary codes for k * oversample candidates and rescore those exactly.
+    """
+
+    def __init__(self, persist_dir, embedding, oversample=None, quantized=True):
+        self.persist_dir = persist_dir
+        self.embedding = embedding
+        with open(os.path.join(persist_dir, VECTORS_META), "r") as f:
+            meta = json.load(f)
+        self.count = meta["count"]
+        self.dim = meta["dim"]
+        self.quantization = meta.get("quantization") if quantized else None
+        self.oversample = oversample or OVERSAMPLE.get(self.quantization, 1)
+        self.matrix = None
+        if self.count:
+            self.matrix = np.memmap(os.path.join(persist_dir, VECTORS_FILE), dtype=meta["dtype"],
+                                    mode="r", shape=(self.count, self.dim))
+            if self.quantization == "int8":
+                self.codes = np.memmap(os.path.join(persist_dir, INT8_FILE), dtype=np.int8,
+                                       mode="r", shape=(self.count, self.dim))
+                self.scales = np.memmap(os.path.join(persist_dir, SCALES_FILE), dtype=np.float32,
+                                        mode="r", shape=(self.count,))
+            elif self.quantization == "binary":
+                self.codes = np.memmap(os.path.join(persist_dir, BITS_FILE), dtype=np.uint8,
+                                       mode="r", shape=(self.count, (self.dim + 7) // 8))
+        self.conn = sqlite3.connect(f"file:{os.path.join(persist_dir, DOCS_FILE)}?mode=ro",
+                                    uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("NumpyVectorStore is written by my_langchain.vectordb(), not from_texts")
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("NumpyVectorStore is read-only")
+
+    def scores(self, query):
+        if self.matrix.dtype == np.float32:
+            return np.asarray(self.matrix) @ query
+        # float16 has no BLAS path; upcast one block at a time
+        out = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK):
+            block = self.matrix[start:start + SCAN_BLOCK]
+            out[start:start + len(block)] = block.astype(np.float32) @ query
+        return out
+
+    def approximate_scores(self, query):
+        """Similarity from the compact codes only; larger is closer"""
+        out = np.empty(self.count, dtype=np.float32)
+        if self.quantization == "int8":
+            for start in range(0, self.count, SCAN_BLOCK):
+                block = self.codes[start:start + SCAN_BLOCK]
+                out[start:start + len(block)] = (block.astype(np.float32) @ query) * self.scales[start:start + len(block)]
+        else:
+            bits = quantize_binary(query[None, :])[0]
+            for start in range(0, self.count, SCAN_BLOCK):
+                block = self.codes[start:start + SCAN_BLOCK]
+                out[start:start + len(block)] = -POPCOUNT[block ^ bits].sum(axis=1, dtype=np.int32)
+        return out
+
+    def search(self, vector, k):
+        """Row numbers and exact cosine scores of the k nearest vectors"""
+        query = unit_rows([vector])[0]
+        if self.quantization is None:
+            scores = self.scores(query)
+            rows = self.top_k(scores, k)
+            return rows, [float(scores[i]) for i in rows]
+        rows = sorted(self.top_k(self.approximate_scores(query), k * self.oversample))
+        # fancy indexing on the memmap reads only the candidate rows from disk
+        exact = np.asarray(self.matrix[rows], dtype=np.float32) @ query
+        order = np.argsort(-exact)[:k]
+        return [rows[i] for i in order], [float(exact[i]) for i in order]
+
+    def top_k(self, scores, k):
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        return best[np.argsort(-scores[best])].tolist()
+
+    def documents(self, rows):
+        if not rows:
+            return {}
+        with self.lock:
+            found = self.conn.execute(
+                f"SELECT idx, id, text, metadata FROM docs WHERE idx IN ({','.join('?' * len(rows))})", rows
+            ).fetchall()
+        return {idx: Document(page_content=text, metadata=json.loads(metadata), id=doc_id)
+                for idx, doc_id, text, metadata in found}
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        if self.matrix is None:
+            return []
+        rows, scores = self.search(embedding, k)
+        docs = self.documents(rows)
+        return [(docs[i], score) for i, score in zip(rows, scores)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # cosine similarity in [-1, 1] mapped to [0, 1]
+        return lambda score: (score + 1.0) / 2.0